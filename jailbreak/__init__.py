@@ -1,11 +1,18 @@
 #avoid polluting the normal getattr space
-import ast as _ast, inspect as _inspect, itertools as _itertools, asttokens as _asttokens
+import ast as _ast, inspect as _inspect, itertools as _itertools, time as _time, collections as _collections, pickletools as _pickletools, asttokens as _asttokens
 from types import FunctionType as _FunctionType
+from dataclasses import dataclass as _dataclass, field as _field
 
 #config interfaces
-from .models import config, register_user_gadget, register_converter, all_gadgets, set_config as _set_config, applicable_converters as _applicable_converters
+from .models import config, register_user_gadget, unregister_user_gadget, register_converter, all_gadgets, set_config as _set_config, applicable_converters as _applicable_converters, catalog_hooks as _catalog_hooks, config_hooks as _config_hooks, converter_hooks as _converter_hooks
 
 from . import converters, utils, gadgets, models
+from .utils.depgraph import DependencyGraph as _DependencyGraph
+from .utils.feasibility import FeasibilityMatrix as _FeasibilityMatrix
+from .utils.index import CatalogIndex as _CatalogIndex
+from .utils.dominance import dominators as _dominators
+from .utils.learning import profile_features as _profile_features
+from .utils.inference import infer_restrictions
 
 #
 # Gadget traverser below
@@ -19,13 +26,17 @@ def _handle_blacklist(restrictions: set, checks: list):
     #in blacklist mode, if the type doesnt exist in checks, we assume it supports nothing and thus all restrictions are violated
     return set(restrictions).intersection(set(checks)) if checks else set(restrictions)
 
-def _manual_check(all_nodes: list, tokens: _asttokens.ASTTokens, exempt_tokens: set):
+def _manual_check(field: str):
     #handle manual information
-    checks = {}
-    if _ast.get_docstring(tokens.tree.body[0]) != None:
-        for line in _ast.get_docstring(tokens.tree.body[0]).strip().splitlines():
-            field, val = line.strip().split(':', 1)
-            checks[field.strip()] = _ast.literal_eval(val.strip())
+    def parser(all_nodes: list, tokens: _asttokens.ASTTokens, exempt_tokens: set):
+        checks = {}
+        if _ast.get_docstring(tokens.tree.body[0]) != None:
+            for line in _ast.get_docstring(tokens.tree.body[0]).strip().splitlines():
+                name, val = line.strip().split(':', 1)
+                checks[name.strip()] = _ast.literal_eval(val.strip())
+        #gadgets without the field in their docstring are assumed to support everything (see _handle_whitelist)
+        return checks.get(field, [])
+    return parser
 
 #supported fields; field name -> matcher, parser
 #e.g. restrictions are a, b and checks are b, c, d
@@ -42,11 +53,12 @@ _restrictions_mapping = {
         lambda all_nodes, tokens, exempt_tokens: {''.join(tok.string for tok in tokens.token_range(n.first_token, n.last_token) if tok not in exempt_tokens) for n in all_nodes if hasattr(n, 'first_token')}
     ),
     #docstring fields
-    'platforms': (_handle_whitelist, _manual_check),
-    'versions': (_handle_whitelist, _manual_check),
+    'platforms': (_handle_whitelist, _manual_check('platforms')),
+    'versions': (_handle_whitelist, _manual_check('versions')),
 }
 
-def _count_violations_python(func_ast: _ast.Module, required_gadgets: 'list[_FunctionType]') -> dict:
+#parses the checks of each field in fields (all supported fields by default) out of the gadget, for the matchers to match restrictions against
+def _extract_features_python(func_ast: _ast.Module, required_gadgets: 'list[_FunctionType]', fields: 'list[str]' = _restrictions_mapping) -> dict:
     #add token info
     tokens = _asttokens.ASTTokens(_ast.unparse(func_ast), func_ast)
 
@@ -84,15 +96,66 @@ def _count_violations_python(func_ast: _ast.Module, required_gadgets: 'list[_Fun
 
     Traverser().visit(tokens.tree)
 
+    return {field: _restrictions_mapping[field][1](all_nodes, tokens, exempt_tokens) for field in fields}
+
+#pickle gadgets are raw bytes, so all fields are parsed in a single pass over the opcodes instead (see _extract_features_pickle); field name -> matcher
+#restricted chars and substrs can be given as either str or bytes, str is treated as latin-1 so it maps to bytes 1:1
+def _latin1(value) -> str:
+    if isinstance(value, int):
+        return chr(value)
+    return value.decode('latin-1') if isinstance(value, (bytes, bytearray)) else value
+
+_pickle_restrictions_mapping = {
+    #opcode names as in pickletools, e.g. 'GLOBAL', 'REDUCE'
+    'opcode': lambda restrictions, checks: set(restrictions).intersection(checks),
+    'char': lambda restrictions, checks: {res for res in restrictions if _latin1(res) in checks},
+    'substr': lambda restrictions, checks: {res for res in restrictions if any(_latin1(res) in check for check in checks)},
+    #globals as module.name, banning a module also bans everything in it
+    'global': lambda restrictions, checks: {res for res in restrictions if any(check == res or check.startswith(res + '.') for check in checks)},
+}
+
+#single pass over the opcodes of every raw bytes part of the gadget (the spliced in gadgets and params are checked on their own)
+#XXX substrs that span across a splice are not caught, the same way python gadgets exempt the names of required gadgets
+def _extract_features_pickle(data: 'list[bytes | str]', required_gadgets: 'list[_FunctionType]', fields: 'list[str]' = _pickle_restrictions_mapping) -> dict:
+    opcodes, segments, globals = set(), [], set()
+    for part in data:
+        if not isinstance(part, bytes):
+            continue
+        segments.append(part.decode('latin-1'))
+
+        strings = []  #strings pushed so far, for STACK_GLOBAL which takes its module and name from the stack
+        try:
+            for opcode, arg, _ in _pickletools.genops(part):
+                opcodes.add(opcode.name)
+                if opcode.name in ['GLOBAL', 'INST']:
+                    globals.add(arg.replace(' ', '.'))
+                elif opcode.name == 'STACK_GLOBAL' and len(strings) >= 2:
+                    globals.add('.'.join(strings[-2:]))
+                if isinstance(arg, str):
+                    strings.append(arg)
+        except ValueError as e:
+            #parts are not full pickles, so running out of bytes without a STOP is expected
+            if 'exhausted' not in str(e):
+                raise
+
+    features = {'opcode': opcodes, 'char': {c for segment in segments for c in segment}, 'substr': segments, 'global': globals}
+    return {field: features[field] for field in fields}
+
+#matchers of each gadget type; field name -> matcher
+_matchers_mapping = {
+    'python': {field: matcher for field, (matcher, _) in _restrictions_mapping.items()},
+    'pickle': _pickle_restrictions_mapping,
+}
+
+#matches the restrictions (the configured ones by default) against features from a _extract_features function
+def _match_violations(features: dict, matchers: dict, restrictions: dict = None) -> dict:
     violations = {}
-    for field, restrictions in _set_config['restrictions'].items():
+    for field, restrictions in (restrictions if restrictions is not None else _set_config['restrictions']).items():
         #apply the right handlers to the restriction type
-        assert field in _restrictions_mapping, f"unsupported type {field}!"
-        matcher, parser = _restrictions_mapping[field]
+        assert field in matchers, f"unsupported type {field}!"
+        matcher = matchers[field]
 
-        type_violations = matcher(restrictions, parser(all_nodes, tokens, exempt_tokens))
-        
-        #print(func_ast.body[0].name, field, type_violations)
+        type_violations = matcher(restrictions, features[field])
 
         #only track it if it has a violation
         if type_violations:
@@ -100,77 +163,806 @@ def _count_violations_python(func_ast: _ast.Module, required_gadgets: 'list[_Fun
 
     return violations
 
+def _count_violations_python(func_ast: _ast.Module, required_gadgets: 'list[_FunctionType]') -> dict:
+    #only parse what the restrictions need
+    return _match_violations(_extract_features_python(func_ast, required_gadgets, [field for field in _set_config['restrictions'] if field in _restrictions_mapping]), _matchers_mapping['python'])
+
+def _count_violations_pickle(data: 'list[bytes | str]', required_gadgets: 'list[_FunctionType]') -> dict:
+    return _match_violations(_extract_features_pickle(data, required_gadgets), _matchers_mapping['pickle'])
+
 
 _count_violations_mapping = {
     'python': _count_violations_python,
+    'pickle': _count_violations_pickle,
+}
+
+#gadget types with a _extract_features function get the catalog wide feasibility prefilter (see utils/feasibility.py)
+_extract_features_mapping = {
+    'python': _extract_features_python,
+    'pickle': _extract_features_pickle,
 }
 
-def _choose_converter_for_violation(type: str, violation, gadget: 'models.GadgetBase', all_gadgets: 'dict[str, _FunctionType]', seen: 'list[str]', converter_class: 'type[models.ConverterBase]', gadget_type: str) -> 'models.ConverterBase | None':
+#applicable converters (violation type -> { violation -> converter functions }) that convert the given gadget type
+def _type_converters(gadget_type: str) -> dict:
+    return {
+        type: {violation: [c for c in funcs if models.converter_gadget_types[c] == gadget_type] for violation, funcs in type_violations.items()}
+        for type, type_violations in _applicable_converters.items()
+    }
+
+#static dependency graphs of the gadget catalogs, built on first search and kept up to date as gadgets are (un)registered
+_dependency_graphs: 'dict[str, _DependencyGraph]' = {}
+
+def _get_graph(gadget_type: str) -> _DependencyGraph:
+    if gadget_type not in _dependency_graphs:
+        _dependency_graphs[gadget_type] = _DependencyGraph(all_gadgets[gadget_type])
+    return _dependency_graphs[gadget_type]
+
+#feasibility matrices of the gadget catalogs (for gadget types with a _extract_features function), also built on first search
+_feasibility_matrices: 'dict[str, _FeasibilityMatrix]' = {}
+
+def _get_feasibility(gadget_type: str) -> '_FeasibilityMatrix | None':
+    if gadget_type not in _extract_features_mapping:
+        return None
+    if gadget_type not in _feasibility_matrices:
+        extract_features = _extract_features_mapping[gadget_type]
+        gadget_class = models.gadget_type_mapping[gadget_type]
+        #features of the unconverted variant, same as what _try_gadget would count violations on
+        extract = lambda name, func: extract_features(gadget_class(func).extract(), _inspect.getfullargspec(func).kwonlyargs)
+        _feasibility_matrices[gadget_type] = _FeasibilityMatrix(extract, _matchers_mapping[gadget_type], all_gadgets[gadget_type])
+    return _feasibility_matrices[gadget_type]
+
+#capability query indexes of the gadget catalogs (see utils/index.py), built with the catalog on the first find
+_catalog_indexes: 'dict[str, _CatalogIndex]' = {}
+
+def _get_index(gadget_type: str) -> _CatalogIndex:
+    if gadget_type not in _catalog_indexes:
+        matrix = _get_feasibility(gadget_type)
+        if matrix is None: raise NameError(f'gadget type {gadget_type} has no feature extraction to index!')
+        #sizes of the unconverted variants, same as what the searcher starts from
+        size = lambda variant: _own_size(all_gadgets[gadget_type][variant], (), _inspect.getfullargspec(all_gadgets[gadget_type][variant]).kwonlyargs, gadget_type)
+        _catalog_indexes[gadget_type] = _CatalogIndex(matrix, _get_graph(gadget_type), size)
+    return _catalog_indexes[gadget_type]
+
+def _update_catalog_indexes(gadget_type: str, name: str, func: '_FunctionType | None'):
+    #query indexes last, they are built on top of the other two
+    for indexes in [_dependency_graphs, _feasibility_matrices, _catalog_indexes]:
+        if gadget_type in indexes:
+            if func:
+                indexes[gadget_type].add(name, func)
+            else:
+                indexes[gadget_type].remove(name)
+
+#(gadget type, restrictions, whether sizes matter, catalog version) -> gadget name -> variant -> variants dominating it (see utils/dominance.py)
+_dominance_cache: 'dict[tuple, dict[str, dict[str, list[str]]]]' = {}
+
+#dominated variants of name (a gadget name requested in the search) under the current config
+def _get_dominators(name: str, gadget_type: str, groups) -> 'dict[str, list[str]]':
+    #keyed by the restrictions rather than groups.clean, which grows as rows of the catalog are computed (see utils/feasibility.py)
+    restricted = frozenset((field, value) for field, values in _set_config['restrictions'].items() if field in _matchers_mapping[gadget_type] for value in values)
+    key = (gadget_type, restricted, _set_config['max_len'] is not None, models.catalog_version)
+    if key not in _dominance_cache:
+        #only the latest profile is kept around, config sweeps would pile them up otherwise
+        _dominance_cache.clear()
+        _dominance_cache[key] = {}
+    by_name = _dominance_cache[key]
+
+    if name not in by_name:
+        graph, feasibility, gadgets = _get_graph(gadget_type), _get_feasibility(gadget_type), all_gadgets[gadget_type]
+        #siblings only, variants of longer names (e.g. system for sys) are not interchangeable
+        variants = [v for v in graph.variants(name) if v.split('__')[0] == name]
+        clean = {v for v in variants if feasibility.is_in(v, groups.clean)}
+        size = (lambda v: _own_size(gadgets[v], (), graph.requires[v], gadget_type)) if _set_config['max_len'] is not None else None
+        by_name[name] = _dominators(variants, clean, graph.requires, size)
+    return by_name[name]
+
+#split the catalogs that are already built for the new restrictions right away, so searches (and profile sweeps) only do lookups
+def _classify_catalogs(set_config: dict):
+    for gadget_type, matrix in _feasibility_matrices.items():
+        matrix.groups(set_config['restrictions'], _type_converters(gadget_type))
+
+_catalog_hooks.append(_update_catalog_indexes)
+_config_hooks.append(_classify_catalogs)
+
+#request from a search frame to resolve gadget name, with via (the gadget variant of the frame) added to the path
+_Try = _collections.namedtuple('_Try', ['name', 'via'])
+
+#with a bounded payload length, frames hand every chain they find to the frame below one at a time instead of only returning the first one (see _enumerate_variant)
+#the frame below gets (record index, frame) back for a _Try, and can ask the suspended frame for its next chain with _Next - or gets None once there are no more
+_Found = _collections.namedtuple('_Found', ['index'])
+_Next = _collections.namedtuple('_Next', ['frame', 'via'])
+
+#persistent path of the gadget variants being resolved from the requested gadget to the current one, extending a path shares its tail
+_Path = _collections.namedtuple('_Path', ['name', 'parent', 'depth'])
+
+#lightweight stand in for a gadget or converter during the search, only the returned chain is turned into models (see _SearchState.build)
+#func is None for dummies (provided gadgets), dependencies and converters are indices into the records of the search
+#size is a lower bound of the payload size of the chain, and lines the amount of (non empty) lines it takes up in it (both 0 when there is no max_len, see config(max_len=...))
+_Record = _collections.namedtuple('_Record', ['name', 'func', 'dependencies', 'converters', 'size', 'lines'], defaults=[0])
+
+#python chains are put into the function body of the gadget using them, so every line of a required chain is indented once more in there
+_NESTED_INDENT = 4
+
+#search wide state, created for every requested gadget search
+#the search runs on an explicit stack of frames (generators from _try_gadget) instead of recursion, see run
+class _SearchState:
+    def __init__(self, name: str, gadget_type: str) -> None:
+        self.name = name
+        self.gadget_type = gadget_type
+        self.tracer = _set_config['tracer']
+        self.matchers = _matchers_mapping.get(gadget_type)
+        #only python gadgets have inline
+        self.gadget_class = models.PythonGadgetInline if gadget_type == 'python' and _set_config['inline'] else models.gadget_type_mapping[gadget_type]
+        self.converter_class = models.converter_type_mapping[gadget_type]
+        #only converters for the gadget type can be applied
+        self.applicable_converters = _type_converters(gadget_type)
+
+        #explicit stack, see start and run
+        self.all_gadgets: 'dict[str, _FunctionType | int]' = {}
+        self.stack: list = []
+        self.result: 'int | None' = None
+        self._resume = (None, None)
+        #current path, and how many times each gadget variant is in it for constant time cycle checks
+        self.path: '_Path | None' = None
+        self.on_path: 'dict[str, int]' = {}
+
+        #budgets, see config(deadline_ms=..., max_expansions=...)
+        self.started = _time.perf_counter()
+        self.deadline = self.started + _set_config['deadline_ms'] / 1000 if _set_config['deadline_ms'] is not None else None
+        self.max_expansions = _set_config['max_expansions']
+        self.expansions = 0
+
+        #payload length cap, see config(max_len=...)
+        #the record sizes are only lower bounds of non inline payloads, since inlining can make a chain shorter than its parts
+        #so inline chains are only checked once complete (the sizes still tell which converters make shorter chains though)
+        self.max_len = _set_config['max_len']
+        #bounded searches try every chain of every required gadget until one fits (see _enumerate_variant), instead of the first chain found for each of them
+        self.bounded = self.max_len is not None and not (gadget_type == 'python' and _set_config['inline'])
+        #running lower bound of the payload size, i.e. the sizes of everything the frames on the stack (or kept by them) have put into the chain so far
+        self.bound = 0
+        #whether a chain was dropped for its length without trying the other chains of its required gadgets (inline searches), so no chain found does not mean there is none
+        self.incomplete = False
+
+        #every gadget and converter the search came up with, frames pass around indices into this instead of models
+        self.records: 'list[_Record]' = []
+        #record index -> model, for records that were built
+        self.built: 'dict[int, models.ModelBase]' = {}
+
+        #closest incomplete chain for every gadget name that failed, for suggesting a chain when no complete chain is found
+        #name -> (score, gadget record, list of dependencies still to be added to gadget at materialization - either a record, or a name to look up in partials, violations left in gadget)
+        #score is the amount of violations left in the chain, plus the amount of required gadgets that have no chain at all
+        self.partials: 'dict[str, tuple[int, int, list, dict]]' = {}
+        self.materialized: 'dict[str, models.GadgetBase]' = {}
+
+        #converter func -> converter record with its dependencies resolved, or None if they cannot be resolved
+        self.converters: 'dict[_FunctionType, int | None]' = {}
+        #amount of times a gadget variant was skipped for being in the current path (or for the length of the path, see exceeds_bound), for telling whether a failure depended on the path
+        self.seen_skips = 0
+        #gadget variants that failed regardless of the path, same as converters being remembered as unusable
+        self.failed: 'set[str]' = set()
+        #gadget variants skipped for being dominated, see config(dominance=...)
+        self.pruned = 0
+        #statistics of past searches to order the variants by and record into, and the features of the profile to record them under (see config(learning=...))
+        self.learning = _set_config['learning'] or None
+        self.features = _profile_features(_set_config['restrictions']) if self.learning else []
+        #whether the search is one of several names sharing one payload (see multi), where gadgets found for the names searched before cost nothing more
+        self.shared = False
+
+    #length of the current path, i.e. how deep the frame on top of the stack is
+    @property
+    def depth(self) -> int:
+        return self.path.depth if self.path else 0
+
+    #all_gadgets should be a copy of the gadget mapping, memoized gadgets (their record indices) replace their funcs in it as they are found
+    def start(self, all_gadgets: 'dict[str, _FunctionType]'):
+        self.all_gadgets = all_gadgets
+        self.stack = [_try_gadget(self.name, self)]
+
+    #resumes the frames on the stack until the search is done (returns True, with the chain in result), or max_steps frames have been resumed (returns False)
+    #a suspended search continues where it left off on the next call; exceptions from the frames (e.g. _BudgetExhausted) propagate through the frames below like they would with recursion
+    def run(self, max_steps: int = None) -> bool:
+        steps = 0
+        while self.stack:
+            if max_steps is not None and steps >= max_steps:
+                return False
+            steps += 1
+
+            value, error = self._resume
+            self._resume = (None, None)
+            try:
+                request = self.stack[-1].throw(error) if error else self.stack[-1].send(value)
+            except StopIteration as e:
+                self._return(e.value, None)
+            except Exception as e:
+                self._return(None, e)
+            else:
+                if isinstance(request, _Found):
+                    #a chain for the frame below, which keeps the suspended frame for asking for the next one
+                    self._return((request.index, self.stack[-1]), None)
+                    continue
+                #the frame needs a gadget resolved (or the next chain from a frame it kept), run it as a frame on top
+                self.path = _Path(request.via, self.path, self.depth + 1)
+                self.on_path[request.via] = self.on_path.get(request.via, 0) + 1
+                self.stack.append(request.frame if isinstance(request, _Next) else _try_gadget(request.name, self))
+        return True
+
+    def _return(self, value, error):
+        self.stack.pop()
+        if self.stack:
+            #back to the requesting frame, so its variant leaves the path
+            self.on_path[self.path.name] -= 1
+            self.path = self.path.parent
+            self._resume = (value, error)
+        elif error:
+            raise error
+        else:
+            self.result = value
+
+    #called every time a gadget variant is tried, stops the search if a budget is exhausted
+    def expand(self):
+        #checked before counting, so the report never has more expansions than the budget
+        if self.max_expansions is not None and self.expansions >= self.max_expansions:
+            raise _BudgetExhausted('max_expansions')
+        self.expansions += 1
+        if self.deadline is not None and _time.perf_counter() > self.deadline:
+            raise _BudgetExhausted('deadline')
+
+    #own and own_lines are the size and lines of the gadget by itself (see _own_size), the chains it uses are added on top
+    #(converter records already count their dependencies as nested into the gadget, see nested_size)
+    def record(self, name: str, func: '_FunctionType | None', dependencies: 'list[int]' = (), converters: 'tuple[int]' = (), own: int = 0, own_lines: int = 0) -> int:
+        size = own + sum(self.nested_size(i) for i in dependencies) + sum(self.records[i].size for i in converters)
+        lines = own_lines + sum(self.records[i].lines for i in [*dependencies, *converters])
+        self.records.append(_Record(name, func, tuple(dependencies), tuple(converters), size, lines))
+        return len(self.records) - 1
+
+    #size the chain at index takes up in the gadget requiring it (or the converter of the gadget), lines indented included
+    def nested_size(self, index: int) -> int:
+        record = self.records[index]
+        return record.size + _NESTED_INDENT * record.lines
+
+    #exact length of the payload of the chain at index, with the param names as the params (same as utils/profiles.py)
+    def payload_length(self, index: int) -> int:
+        gadget = self.build(index, self.gadget_class, self.converter_class)
+        return len(gadget(*_inspect.getfullargspec(gadget.func).args if not gadget.dummy else []))
+
+    #picks up where previous (a search that found a chain under previous_config) left off, if config() only added to the restrictions, banned or provided since
+    #the chains it found are kept unless a gadget in them is now banned, requires a newly provided gadget, or violates the added restrictions (its violation signature, i.e. its cached features, touches them)
+    #so only the invalidated subtrees are searched again; returns whether anything was reused
+    #XXX failures are only reused if nothing was added to provided, since a newly provided gadget can make a failed variant work
+    def resume(self, previous: '_SearchState', previous_config: dict) -> bool:
+        if any(previous_config[key] != _set_config[key] for key in ['inline', 'order', 'max_len', 'costs', 'dominance', 'learning']):
+            return False
+        old, new = _restriction_sets(previous_config['restrictions']), _restriction_sets(_set_config['restrictions'])
+        if any(field not in new or not values <= new[field] for field, values in old.items()):
+            return False
+        if not set(previous_config['banned']) <= set(_set_config['banned']) or not set(previous_config['provided']) <= set(_set_config['provided']):
+            return False
+
+        added = {field: values - old.get(field, set()) for field, values in new.items() if values - old.get(field, set())}
+        provided = set(_set_config['provided']) - set(previous_config['provided'])
+        banned = set(_set_config['banned'])
+
+        #only the records of the chains found matter (not e.g. the partial ones)
+        memo = {gadget_name: value for gadget_name, value in previous.all_gadgets.items() if isinstance(value, int)}
+        used, todo = set(), [i for i in [*memo.values(), *previous.converters.values()] if i is not None]
+        while todo:
+            i = todo.pop()
+            if i not in used:
+                used.add(i)
+                todo += previous.records[i].dependencies + previous.records[i].converters
+
+        #dependencies always have a lower index than their dependents, so one pass in order does
+        feasibility = _get_feasibility(self.gadget_type)
+        valid = {}
+        for i in sorted(used):
+            record = previous.records[i]
+            ok = record.name not in banned and all(valid[d] for d in record.dependencies + record.converters)
+            if ok and record.func is not None:
+                required_gadgets = _inspect.getfullargspec(record.func).kwonlyargs
+                ok = not provided.intersection(required_gadgets)
+                if ok and added and record.func not in models.registered_converters:
+                    #same violations as before means the same converters would be chosen, which then have to get rid of the added ones too
+                    signatures = [feasibility.row(record.name) if feasibility else None]
+                    if record.converters:
+                        signatures.append(_convert(record.func, tuple(previous.records[c].func for c in record.converters), required_gadgets, self.gadget_type)[1])
+                    ok = all(features is not None and not _match_violations(features, self.matchers, added) for features in signatures)
+            valid[i] = ok
+
+        #carry over the records of the chains that are still valid, renumbered
+        memo = {gadget_name: i for gadget_name, i in memo.items() if valid[i]}
+        converters = {func: c for func, c in previous.converters.items() if (c is None and not provided) or (c is not None and valid[c])}
+        keep = sorted(i for i in used if valid[i])
+        index = {old: new for new, old in enumerate(keep)}
+        for old in keep:
+            record = previous.records[old]
+            self.records.append(record._replace(dependencies=tuple(index[i] for i in record.dependencies), converters=tuple(index[i] for i in record.converters)))
+
+        self.all_gadgets.update({gadget_name: index[i] for gadget_name, i in memo.items()})
+        self.converters = {func: index[c] if c is not None else None for func, c in converters.items()}
+        if not provided:
+            self.failed = set(previous.failed)
+        return True
+
+    #tried is (variant, seen_skips and expansions when it was tried) of a variant that failed, or None
+    def note_failed(self, tried: 'tuple[str, int, int] | None'):
+        if tried and tried[1] == self.seen_skips:
+            self.failed.add(tried[0])
+            if self.learning:
+                self.learning.record(tried[0], self.features, False, self.expansions - tried[2] + 1)
+
+    #same as note_failed, for a variant that got a chain
+    def note_found(self, tried: 'tuple[str, int, int]'):
+        if self.learning:
+            self.learning.record(tried[0], self.features, True, self.expansions - tried[2] + 1)
+
+    #whether the running bound is already over max_len, in which case the variant of the frame is dropped
+    def exceeds_bound(self, gadget_name: str) -> bool:
+        if not self.bounded or self.bound <= self.max_len:
+            return False
+        if self.tracer:
+            self.tracer.emit('length_pruned', self.depth, gadget=gadget_name, bound=self.bound, max_len=self.max_len)
+        #the bound includes the gadgets on the path, so this failure depended on the path too
+        self.seen_skips += 1
+        return True
+
+    #whether the chain at index fits in max_len - only checked for the requested gadget, since its chain is the payload
+    #if not, it is kept as a suggestion with the length as its violation
+    def fits(self, name: str, index: int) -> bool:
+        if self.max_len is None or self.depth:
+            return True
+        length = self.payload_length(index)
+        if length <= self.max_len:
+            return True
+        if self.tracer:
+            self.tracer.emit('length_exceeded', self.depth, gadget=self.records[index].name, length=length, max_len=self.max_len)
+        self.add_partial(name, 1, index, [], {'max_len': {length}})
+        #the other chains of the required gadgets are only tried when bounded
+        self.incomplete = self.incomplete or not self.bounded
+        return False
+
+    #memoizes every gadget in the chain at index, for the names searched after it (see multi) and for resuming (see resume)
+    #bounded searches do not memoize while searching, since a chain found for a gadget is not necessarily the one that fits
+    def memoize(self, index: int):
+        todo = [index]
+        while todo:
+            i = todo.pop()
+            record = self.records[i]
+            if record.func is not None and record.func not in models.registered_converters:
+                self.all_gadgets[record.name] = i
+            todo += record.dependencies + record.converters
+
+    #turns the record at index (and everything it depends on) into models, records used more than once share one model like memoized gadgets did
+    #dependencies always have a lower index than their dependents, so this never loops
+    def build(self, index: int, gadget_class: 'type[models.GadgetBase]', converter_class: 'type[models.ConverterBase]') -> 'models.ModelBase':
+        stack = [(index, gadget_class)]
+        while stack:
+            i, model_class = stack[-1]
+            if i in self.built:
+                stack.pop()
+                continue
+
+            record = self.records[i]
+            todo = [(c, converter_class) for c in record.converters if c not in self.built] + [(d, gadget_class) for d in record.dependencies if d not in self.built]
+            if todo:
+                stack.extend(todo)
+                continue
+            stack.pop()
+
+            if record.func is None:
+                self.built[i] = model_class(name=record.name, dummy=True)
+                continue
+
+            model = model_class(record.func)
+            if record.converters:
+                converters = [self.built[c] for c in record.converters]
+                new_data, _ = _convert(record.func, tuple(c.func for c in converters), _inspect.getfullargspec(record.func).kwonlyargs, self.gadget_type)
+                #the cached data is shared, give the gadget its own copy
+                model.apply_converters(converters, models._copy_tree(new_data))
+            for dep in record.dependencies:
+                model.add_dependency(self.built[dep])
+            self.built[i] = model
+
+        return self.built[index]
+
+    def add_partial(self, name: str, score: int, gadget: int, pending: list, violations: dict = None):
+        #ties keep the earlier one, same as the traversal order
+        if self.improves_partial(name, score):
+            self.partials[name] = (score, gadget, pending, violations)
+
+    def improves_partial(self, name: str, score: int) -> bool:
+        return name not in self.partials or score < self.partials[name][0]
+
+    def partial_score(self, name: str) -> int:
+        #no candidates at all counts as a single missing gadget
+        return self.partials[name][0] if name in self.partials else 1
+
+    #builds the partial chain of name; missing gadgets are filled in with dummies, and remaining violations are recorded into violations
+    def materialize(self, name: str, gadget_class: 'type[models.GadgetBase]', converter_class: 'type[models.ConverterBase]', violations: dict, missing: list, building: set = frozenset()) -> 'models.GadgetBase':
+        #only materialize once, the gadget is a (partial) chain by itself after
+        if name in self.materialized:
+            return self.materialized[name]
+        if name not in self.partials or name in building:
+            missing.append(name)
+            return gadget_class(name=name, dummy=True)
+
+        score, record, pending, gadget_violations = self.partials[name]
+        if gadget_violations:
+            violations[self.records[record].name] = gadget_violations
+
+        #partial records are never shared, so adding the pending dependencies to the model is fine
+        gadget = self.build(record, gadget_class, converter_class)
+        for dep in pending:
+            if isinstance(dep, str):
+                dep = self.materialize(dep, gadget_class, converter_class, violations, missing, building | {name})
+            else:
+                dep = self.build(dep, gadget_class, converter_class)
+            gadget.add_dependency(dep)
+        self.materialized[name] = gadget
+        return gadget
+
+
+class _BudgetExhausted(Exception):
+    pass
+
+
+#report of the latest requested gadget search
+@_dataclass
+class SearchReport:
+    name: str
+    #why the search stopped, one of:
+    # - found: a complete chain was found
+    # - exhausted: every option was tried and there is no complete chain
+    # - incomplete: no chain was found, but some were dropped for max_len without trying every chain of their required gadgets (inline searches, multi), so a shorter one may exist
+    # - deadline / max_expansions: the respective budget set in config ran out
+    stop_reason: str
+    complete: bool
+    expansions: int
+    elapsed_ms: float
+    #only set for incomplete chains - the closest partial chain, the violations it still has per gadget,
+    #and the gadget names without any chain (or never searched, since the gadget requiring them has violations)
+    partial: 'models.GadgetBase | None' = None
+    violations: dict = _field(default_factory=dict)
+    missing: list = _field(default_factory=list)
+    #whether the result came from the table set in config instead of a search (see utils/profiles.py)
+    from_table: bool = False
+    #whether the search picked up from the previous search of the gadget instead of starting over
+    resumed: bool = False
+    #estimated seconds to run the chain found, only set with config(order='runtime', costs=...) (see utils/runtime.py)
+    runtime_cost: 'float | None' = None
+    #gadget variants skipped for being dominated by a sibling variant, see config(dominance=...)
+    pruned: int = 0
+
+last_search: 'SearchReport | None' = None
+
+
+#last search that found a chain for every (gadget type, name), for re-solving incrementally (see _SearchState.resume)
+#(gadget type, name) -> (set_config of the search, catalog version of the search, search state)
+_solves: 'dict[tuple[str, str], tuple[dict, int, _SearchState]]' = {}
+
+#restrictions as sets of restricted values, e.g. char='\'"' -> {"'", '"'}
+def _restriction_sets(restrictions: dict) -> dict:
+    return {field: set(values) for field, values in restrictions.items()}
+
+
+#search frames below (generators run by _SearchState.run) yield _Try to resolve a gadget, and get the resolved gadget (or None) sent back
+
+def _choose_converter_for_violation(type: str, violation, gadget_name: str, state: _SearchState) -> 'int | None':
+    tracer = state.tracer
+
     #choose first one that would succeed under our jail (there is no point in trying other converters if this one succeeds, assuming the kwargs annotations via @register_converter accurately depicts what the converter does)
-    for converter_func in _applicable_converters[type][violation]:
-        converter = converter_class(converter_func)
-        converter_required_gadgets = _inspect.getfullargspec(converter_func).kwonlyargs
-        for next_gadget in converter_required_gadgets:
-            gadget = _try_gadget(next_gadget, all_gadgets, seen + [gadget.name], gadget_type)
-            if not gadget:
-                continue  #not all dependencies can be resolved, next converter
-            converter.add_dependency(gadget)  #we can add dependencies on the fly since if the converter is bad we throw it away anyway
-        return converter
+    #unless the payload length is capped, then the one with the shortest dependency chain is chosen out of all that succeed
+    best = None
+    for converter_func in state.applicable_converters[type][violation]:
+        #converter dependencies are only resolved once per search, then reused by every gadget with the same violation
+        if converter_func in state.converters:
+            converter = state.converters[converter_func]
+            if converter is None:
+                continue
+        else:
+            dependencies = []
+            seen_skips = state.seen_skips
+            for next_gadget in _inspect.getfullargspec(converter_func).kwonlyargs:
+                dependency = yield _Try(next_gadget, gadget_name)
+                if dependency is None:
+                    break  #not all dependencies can be resolved, next converter
+                dependencies.append(dependency)
+            else:
+                state.converters[converter_func] = converter = state.record(converter_func.__name__, converter_func, dependencies)
+
+            if converter_func not in state.converters:
+                #only remember it as unusable if it failed regardless of the path we are on (same as memoization only remembering successful gadgets)
+                if state.seen_skips == seen_skips:
+                    state.converters[converter_func] = None
+                continue
+
+        if state.max_len is None:
+            best = converter
+            break
+        if best is None or state.records[converter].size < state.records[best].size:
+            best = converter
+
+    if tracer and best is not None:
+        tracer.emit('converter_chosen', state.depth + 1, gadget=gadget_name, converter=state.records[best].func.__name__, type=type, violation=violation)
+    return best
+
+#converted data of a gadget for a converter application order, along with its features (see _extract_features_python) for counting the violations left under any restrictions
+#converters only depend on the gadget source so this is shared by every search (and profile); (gadget func, converter funcs) -> (interned data, features or None)
+_conversion_cache: 'dict[tuple, tuple]' = {}
+
+def _convert(func: _FunctionType, apply: 'tuple[_FunctionType]', required_gadgets: 'list[str]', gadget_type: str) -> 'tuple[object, dict]':
+    key = (func, apply)
+    if key not in _conversion_cache:
+        #converting does not need the dependencies of the gadget or converters, so plain models do
+        gadget = models.gadget_type_mapping[gadget_type](func)
+        converter_class = models.converter_type_mapping[gadget_type]
+        new_data = converter_class.convert_all([converter_class(converter_func) for converter_func in apply], gadget.extract(), gadget)
+
+        features = None
+        if gadget_type in _extract_features_mapping:
+            #on a copy, asttokens marks every node it visits
+            features = _extract_features_mapping[gadget_type](models._copy_tree(new_data), required_gadgets)
+            if isinstance(new_data, _ast.AST):
+                new_data = models.ast_store.intern(new_data)
+        _conversion_cache[key] = (new_data, features)
+    return _conversion_cache[key]
+
+#(size, non empty lines) of a (converted) gadget by itself in a payload, without its dependencies and params, for bounding the payload size while searching (see config(max_len=...))
+#sizes of the dependencies add up to at most the payload size for both gadget types, since every use of a gadget puts its whole chain into the payload
+#python payloads also indent every line of a chain once more for every gadget it is nested in (see _NESTED_INDENT), and add assigns, blank lines and the final call on top
+def _own_size_python(func: _FunctionType, data: _ast.Module) -> 'tuple[int, int]':
+    gadget = models.PythonGadget(func)
+    gadget.func_ast = data
+    #without the kwonlyargs and docstring, same as in the payload
+    source = _ast.unparse(gadget._render_full_ast())
+    return len(source), sum(1 for line in source.split('\n') if line)
+
+def _own_size_pickle(func: _FunctionType, data: 'list[bytes | str]') -> 'tuple[int, int]':
+    #pickles are not nested, lines do not matter
+    return sum(len(part) for part in data if isinstance(part, bytes)), 0
+
+_own_size_mapping = {
+    'python': _own_size_python,
+    'pickle': _own_size_pickle,
+}
+
+#(gadget func, converter funcs) -> (own size, own lines), shared by every search like _conversion_cache
+_size_cache: 'dict[tuple, tuple[int, int]]' = {}
+
+def _own_size(func: _FunctionType, apply: 'tuple[_FunctionType]', required_gadgets: 'list[str]', gadget_type: str) -> int:
+    return _own_size_and_lines(func, apply, required_gadgets, gadget_type)[0]
+
+def _own_size_and_lines(func: _FunctionType, apply: 'tuple[_FunctionType]', required_gadgets: 'list[str]', gadget_type: str) -> 'tuple[int, int]':
+    key = (func, apply)
+    if key not in _size_cache:
+        new_data, _ = _convert(func, apply, required_gadgets, gadget_type)
+        _size_cache[key] = _own_size_mapping[gadget_type](func, new_data)
+    return _size_cache[key]
+
+#drop the conversions (and sizes) of gadgets and converters that were replaced or removed, everything else stays warm
+def _drop_gadget_conversions(gadget_type: str, name: str, func: '_FunctionType | None'):
+    for cache in [_conversion_cache, _size_cache]:
+        for key in [key for key in cache if key[0].__name__ == name and key[0] is not func]:
+            del cache[key]
+
+def _drop_converter_conversions(converter: _FunctionType, registered: bool):
+    if not registered:
+        for cache in [_conversion_cache, _size_cache]:
+            for key in [key for key in cache if converter in key[1]]:
+                del cache[key]
+
+_catalog_hooks.append(_drop_gadget_conversions)
+_converter_hooks.append(_drop_converter_conversions)
                 
-#if this returns true, the gadget wouldve been rewritten and the gadget will have tracked the converters, else nothing changed
-def _try_convert(gadget: models.GadgetBase, required_gadgets: 'list[_FunctionType]', violations: dict, all_gadgets: 'dict[str, _FunctionType]', seen: 'list[str]', gadget_type: str) -> bool:
+#returns the converter records in the order to apply them to the gadget to get rid of the violations, or None if there is no such order
+def _try_convert(gadget_name: str, func: _FunctionType, required_gadgets: 'list[_FunctionType]', violations: dict, state: _SearchState) -> 'tuple[int] | None':
+    tracer = state.tracer
+    gadget_type = state.gadget_type
+
     #obtain a list of all converters that we should run to avoid the violations
-    converter_class = models.converter_type_mapping[gadget_type]
+    applicable_converters = state.applicable_converters
 
-    converters_to_run: 'set[models.ConverterBase]' = set()
+    converters_to_run: 'dict[int, None]' = {}  #ordered set
     for type, type_violations in violations.items():
-        if type not in _applicable_converters:   #no converters registered for the type
-            return False
+        if type not in applicable_converters:   #no converters registered for the type
+            return None
         
         for violation in type_violations:
-            if violation in _applicable_converters[type] and _applicable_converters[type][violation]:
-                converter = _choose_converter_for_violation(type, violation, gadget, all_gadgets, seen, converter_class, gadget_type)
-                if not converter:
-                    return False #we exhausted all the applicable converters for this violation, give up on this chain
+            if violation in applicable_converters[type] and applicable_converters[type][violation]:
+                converter = yield from _choose_converter_for_violation(type, violation, gadget_name, state)
+                if converter is None:
+                    return None #we exhausted all the applicable converters for this violation, give up on this chain
                 
-                converters_to_run.add(converter)
+                converters_to_run[converter] = None
             else:
-                return False #not all violations can be converted away, give up on this chain
+                return None #not all violations can be converted away, give up on this chain
 
     #XXX dumb heuristic - try all converter application orders to see if any can actually achieve no violations
     #XXX situations where e.g. the strless converter uses chr(), which introduces CALLs and requires callless converter to run on it yet no CALLs were in the main gadget will just fail with this method
     #XXX but if we are lucky (eg main gadget has CALL violations so callless converter is in converters_to_run) then the conversion will pass
+    best = None
     for apply in _itertools.permutations(converters_to_run):
         #all converters in apply should be the same type, choose a random one to extract stuff and apply with
-        new_data = gadget.extract()
-        for converter in apply:
-            new_data = converter.convert(new_data, gadget)
+        apply_funcs = tuple(state.records[c].func for c in apply)
+        new_data, features = _convert(func, apply_funcs, required_gadgets, gadget_type)
         #XXX we are assuming converters do not introduce new regressions, otherwise we will have to rerun the whole conversion test again when we see violations
-        if not _count_violations_mapping[gadget_type](new_data, required_gadgets):
-            #add the required gadget chain(s) into the returned chain along with the transformed func
-            #only here is gadget modified
-            gadget.apply_converters(apply, new_data)
-            return True
+        if features is not None:
+            remaining = _match_violations(features, state.matchers)
+        else:
+            remaining = _count_violations_mapping[gadget_type](models._copy_tree(new_data), required_gadgets)
+        if tracer:
+            tracer.emit('permutation_tried', state.depth + 1, gadget=gadget_name, converters=[f.__name__ for f in apply_funcs], ok=not remaining)
+        if not remaining:
+            #the gadget record tracks these, the converted data is applied when it is built
+            if state.max_len is None:
+                return apply
+            #orders can convert to different lengths, keep the shortest
+            size = _own_size(func, apply_funcs, required_gadgets, gadget_type)
+            if best is None or size < best[0]:
+                best = (size, apply)
 
     #none of the applies worked, so give up
-    return False
+    return best[1] if best else None
 
-#all_gadgets will be replaced with gadgets as we find them
-def _try_gadget(name: str, all_gadgets: 'dict[str, _FunctionType | models.GadgetBase]', seen: 'list[str]', gadget_type: str):
-    #terminate if provided
+#every way of converting away the violations of a gadget, for bounded searches (see _enumerate_variant) - unlike _try_convert, the converters are not resolved yet
+#one converter per violation like _try_convert, but every choice of them instead of the first one that resolves, each in its order giving the shortest gadget
+def _conversion_plans(func: _FunctionType, required_gadgets: 'list[str]', violations: dict, state: _SearchState) -> 'list[tuple[_FunctionType]]':
+    applicable_converters, gadget_type = state.applicable_converters, state.gadget_type
+    choices = []
+    for type, type_violations in violations.items():
+        for violation in type_violations:
+            if not applicable_converters.get(type, {}).get(violation):
+                return []
+            choices.append(applicable_converters[type][violation])
+
+    plans = []
+    for chosen in dict.fromkeys(tuple(dict.fromkeys(chosen)) for chosen in _itertools.product(*choices)):
+        best = None
+        for apply in _itertools.permutations(chosen):
+            new_data, features = _convert(func, apply, required_gadgets, gadget_type)
+            if features is not None:
+                remaining = _match_violations(features, state.matchers)
+            else:
+                remaining = _count_violations_mapping[gadget_type](models._copy_tree(new_data), required_gadgets)
+            if state.tracer:
+                state.tracer.emit('permutation_tried', state.depth + 1, gadget=func.__name__, converters=[f.__name__ for f in apply], ok=not remaining)
+            if not remaining:
+                size = _own_size(func, apply, required_gadgets, gadget_type)
+                if best is None or size < best[0]:
+                    best = (size, apply)
+        if best:
+            plans.append(best[1])
+    return plans
+
+#every chain of a gadget variant under the bound (see config(max_len=...)): every conversion plan, with every combination of chains for the gadgets its converters and itself require
+#the combinations are tried like an odometer - the last required gadget goes through its chains first, and whenever one runs out of chains the one before it moves on to its next chain
+#the frames resolving the required gadgets are kept suspended in between, so a chain is never searched for twice, and a chain over the bound just moves on to the next one
+#chains are handed to the frame below one at a time (see _Found) - or for the requested gadget, checked against max_len, returning the first that fits
+#returns (chain that fits or None, amount of chains found)
+def _enumerate_variant(name: str, gadget_name: str, func: _FunctionType, required_gadgets: 'list[str]', violations: dict, state: _SearchState):
+    tracer = state.tracer
+    plans = _conversion_plans(func, required_gadgets, violations, state) if violations else [()]
+    if not plans:
+        #keep the unconverted gadget around as a suggestion, same as _try_gadget
+        state.add_partial(name, sum(len(v) for v in violations.values()), state.record(gadget_name, func), list(required_gadgets), violations)
 
-    #TODO cache this?
-    gadget_class = models.gadget_type_mapping[gadget_type]
-    #only python gadgets have inline
-    if gadget_type == 'python' and _set_config['inline']:
-        gadget_class = models.PythonGadgetInline
+    #gadget record for apply with the chains in chosen, the converters get theirs first (in the order they were requested in)
+    def record(apply, converter_requires, chosen, own = 0, own_lines = 0) -> int:
+        dependencies, converters, start = [index for index, _ in chosen], [], 0
+        for converter, requires in zip(apply, converter_requires):
+            converters.append(state.record(converter.__name__, converter, dependencies[start:start + len(requires)]))
+            start += len(requires)
+        return state.record(gadget_name, func, dependencies[start:], converters, own, own_lines)
+
+    found = 0
+    for apply in plans:
+        own, own_lines = _own_size_and_lines(func, apply, required_gadgets, state.gadget_type)
+        #gadgets required by the converters, then the ones the gadget requires itself
+        converter_requires = [_inspect.getfullargspec(converter).kwonlyargs for converter in apply]
+        names = [dep for requires in converter_requires for dep in requires] + list(required_gadgets)
+        first_required = len(names) - len(required_gadgets)
+
+        #everything this plan has put into the chain so far, only counted in the running bound while this frame is on the stack
+        added = own
+        state.bound += added
+        if state.exceeds_bound(gadget_name):
+            state.bound -= added
+            continue
+
+        #(record index, frame) of the chain currently used for each name, None for the names that are not resolved yet
+        chosen = [None] * len(names)
+        i = 0
+        while i >= 0:
+            if i == len(names):
+                gadget = record(apply, converter_requires, chosen, own, own_lines)
+                found += 1
+                if not state.depth:
+                    if state.fits(name, gadget):
+                        state.bound -= added
+                        return gadget, found
+                else:
+                    state.bound -= added
+                    yield _Found(gadget)
+                    state.bound += added
+                i -= 1
+                continue
+
+            seen_skips = state.seen_skips
+            try:
+                if chosen[i] is None:
+                    result = yield _Try(names[i], gadget_name)
+                else:
+                    added -= state.nested_size(chosen[i][0])
+                    state.bound -= state.nested_size(chosen[i][0])
+                    result = yield _Next(chosen[i][1], gadget_name)
+            except _BudgetExhausted:
+                #record how far we got on the way out, so the partial chain follows the path the search was on
+                if i >= first_required:
+                    state.add_partial(name, state.partial_score(names[i]), record(apply, converter_requires, chosen[:i]), required_gadgets[i - first_required:])
+                raise
+
+            if result is None:
+                if chosen[i] is None and state.seen_skips == seen_skips:
+                    #no chain at all regardless of the bound and path, other chains for the names before it cannot change that
+                    if tracer:
+                        tracer.emit('dependency_failed', state.depth, gadget=gadget_name, dependency=names[i])
+                    if i >= first_required:
+                        state.add_partial(name, state.partial_score(names[i]), record(apply, converter_requires, chosen[:i]), required_gadgets[i - first_required:])
+                    for index, _ in chosen[:i]:
+                        added -= state.nested_size(index)
+                        state.bound -= state.nested_size(index)
+                    break
+                #out of chains, the name before it moves on to its next chain
+                chosen[i] = None
+                i -= 1
+                continue
+
+            chosen[i] = result
+            added += state.nested_size(result[0])
+            state.bound += state.nested_size(result[0])
+            if not state.exceeds_bound(gadget_name):
+                i += 1
+
+        state.bound -= added
+    return None, found
+
+#all_gadgets (in state) will be replaced with records as we find them
+def _try_gadget(name: str, state: _SearchState):
+    #terminate if provided
 
+    tracer = state.tracer
+    all_gadgets, gadget_type = state.all_gadgets, state.gadget_type
 
     if name in _set_config['provided']:
-        return gadget_class(name=name, dummy=True)
+        if state.bounded and state.depth:
+            yield _Found(state.record(name, None))
+            return None
+        return state.record(name, None)
 
-    for gadget_name, func in all_gadgets.items():
-        if gadget_name in seen:
+    #(variant, seen_skips and expansions when it was tried) of the variant tried last, which failed if we get to the next one (see _SearchState.note_failed)
+    tried = None
+
+    #only variants that could possibly have a chain (see utils/depgraph.py), all other variants would fail on a required gadget anyway
+    candidates = _get_graph(gadget_type).candidates(name, _set_config['provided'], _set_config['banned'], by_cost=_set_config['order'] in ['graph', 'runtime'], costs=_set_config['costs'] if _set_config['order'] == 'runtime' else None)
+    if state.learning:
+        #most likely to work out (for the least effort) first, see utils/learning.py
+        candidates = state.learning.order(candidates, state.features)
+    if state.shared:
+        #already in the payload, try them first (sort is stable, so the rest stay in order)
+        candidates = sorted(candidates, key=lambda v: not isinstance(all_gadgets[v], int))
+    feasibility = _get_feasibility(gadget_type)
+    if feasibility:
+        #rows of every variant for the name, the dominance check needs the siblings that are not candidates too
+        feasibility.ensure(_get_graph(gadget_type).variants(name))
+    groups = feasibility.groups(_set_config['restrictions'], state.applicable_converters) if feasibility else None
+    dominators = _get_dominators(name, gadget_type, groups) if groups and _set_config['dominance'] else {}
+    #candidates passed over so far without a chain, other than for being banned or in the path
+    passed = set()
+    for gadget_name in candidates:
+        state.note_failed(tried)
+        tried = None
+
+        func = all_gadgets[gadget_name]
+        if state.on_path.get(gadget_name):
+            state.seen_skips += 1
             continue
 
         if gadget_name in _set_config['banned']:
@@ -178,47 +970,299 @@ def _try_gadget(name: str, all_gadgets: 'dict[str, _FunctionType | models.Gadget
             continue
 
         if gadget_name.startswith(name):
-            #fast track: if we saw it and the gadget is memoized return early without computing again
-            if isinstance(func, models.GadgetBase):
-                #print('memoized', func)
-                return func
+            #fast track: if we saw it and the gadget is memoized (as its record) return early without computing again
+            if isinstance(func, int):
+                if tracer:
+                    tracer.emit('memo_hit', state.depth, gadget=gadget_name, name=name)
+                if not state.bounded:
+                    return func
+                #the memoized chain first, then the other chains of the variant as usual
+                if not state.depth:
+                    if state.fits(name, func):
+                        return func
+                else:
+                    yield _Found(func)
+                func = state.records[func].func
+
+            passed.add(gadget_name)
 
-            #print('trying', gadget)
+            #failed before regardless of the path, it would just fail again
+            if gadget_name in state.failed:
+                if tracer:
+                    tracer.emit('failure_reused', state.depth, gadget=gadget_name, name=name)
+                continue
 
-            gadget = gadget_class(func)
+            #a sibling with no violations and a subset of the required gadgets got no chain, so this one would not either
+            if dominators and passed.intersection(dominators.get(gadget_name, ())):
+                if tracer:
+                    tracer.emit('gadget_dominated', state.depth, gadget=gadget_name, name=name)
+                state.pruned += 1
+                continue
 
             fullargspec = _inspect.getfullargspec(func)
             required_gadgets = fullargspec.kwonlyargs
-            violations = _count_violations_mapping[gadget_type](gadget.extract(), required_gadgets)
+
+            #no converter can fix it, skip without trying - it is still a suggestion if nothing else works out though
+            if groups and feasibility.is_in(gadget_name, groups.hopeless):
+                if tracer:
+                    tracer.emit('gadget_infeasible', state.depth, gadget=gadget_name, name=name)
+                violations = _match_violations(feasibility.row(gadget_name), state.matchers)
+                score = sum(len(v) for v in violations.values())
+                if state.improves_partial(name, score):
+                    state.add_partial(name, score, state.record(gadget_name, func), list(required_gadgets), violations)
+                continue
+
+            state.expand()
+            tried = (gadget_name, state.seen_skips, state.expansions)
+            if tracer:
+                tracer.emit('gadget_tried', state.depth, gadget=gadget_name, name=name)
+
+            if feasibility:
+                #no need to parse the variant again, the features are cached
+                violations = _match_violations(feasibility.row(gadget_name), state.matchers)
+            else:
+                violations = _count_violations_mapping[gadget_type](models.gadget_type_mapping[gadget_type](func).extract(), required_gadgets)
+
+            if state.bounded:
+                if violations and tracer:
+                    tracer.emit('violations_found', state.depth, gadget=gadget_name, violations=violations)
+                gadget, found = yield from _enumerate_variant(name, gadget_name, func, required_gadgets, violations, state)
+                if found:
+                    #got chains, even if none of them fit - so it did not fail, and siblings it dominates are not bound to fail either
+                    passed.discard(gadget_name)
+                    state.note_found(tried)
+                    tried = None
+                if gadget is not None:
+                    state.memoize(gadget)
+                    return gadget
+                continue
+
+            converters = ()
             if violations:
+                if tracer:
+                    tracer.emit('violations_found', state.depth, gadget=gadget_name, violations=violations)
                 #if conversions cant be done, go to next candidate
-                if not _try_convert(gadget, required_gadgets, violations, all_gadgets, seen, gadget_type):
+                converters = None
+                try:
+                    converters = yield from _try_convert(gadget_name, func, required_gadgets, violations, state)
+                finally:
+                    if converters is None:
+                        #keep the unconverted gadget around as a suggestion, its dependencies are never searched so only the violations count
+                        state.add_partial(name, sum(len(v) for v in violations.values()), state.record(gadget_name, func), list(required_gadgets), violations)
+                if converters is None:
                     continue
 
             #reaching this could mean theres no violations, or the violations are sorted out
-        
-            if not required_gadgets:   #no more to chain, return (base case)
-                return gadget
 
-            good = True
-            for next_gadget in required_gadgets:
-                new_gadget = _try_gadget(next_gadget, all_gadgets, seen + [gadget_name], gadget_type)
+            own, own_lines = _own_size_and_lines(func, tuple(state.records[c].func for c in converters), required_gadgets, gadget_type) if state.max_len is not None else (0, 0)
+            #everything this variant put into the chain so far, taken back out of the running bound once we are done with the variant
+            added = own + sum(state.records[c].size for c in converters)
+            state.bound += added
+            try:
+                if state.exceeds_bound(gadget_name):
+                    continue
+
+                if not required_gadgets:   #no more to chain, return (base case)
+                    gadget = state.record(gadget_name, func, (), converters, own, own_lines)
+                    if state.fits(name, gadget):
+                        state.note_found(tried)
+                        return gadget
+                    continue
 
-                #(at least) one of the required gadgets does not have a valid chain, drop out
-                if not new_gadget:
-                    good = False
-                    break
-                
-                gadget.add_dependency(new_gadget)
+                good = True
+                dependencies = []
+                for i, next_gadget in enumerate(required_gadgets):
+                    try:
+                        new_gadget = yield _Try(next_gadget, gadget_name)
+                    except _BudgetExhausted:
+                        #record how far we got on the way out, so the partial chain follows the path the search was on
+                        state.add_partial(name, state.partial_score(next_gadget), state.record(gadget_name, func, dependencies, converters), required_gadgets[i:])
+                        raise
 
-            if good:
-                #memoize the gadget for fast track return the next time we see it in another branch
-                all_gadgets[gadget_name] = gadget
-                return gadget
-    
+                    #(at least) one of the required gadgets does not have a valid chain, drop out
+                    if new_gadget is None:
+                        if tracer:
+                            tracer.emit('dependency_failed', state.depth, gadget=gadget_name, dependency=next_gadget)
+                        state.add_partial(name, state.partial_score(next_gadget), state.record(gadget_name, func, dependencies, converters), required_gadgets[i:])
+                        good = False
+                        break
+
+                    dependencies.append(new_gadget)
+                    added += state.nested_size(new_gadget)
+                    state.bound += state.nested_size(new_gadget)
+                    if state.exceeds_bound(gadget_name):
+                        good = False
+                        break
+
+                if good:
+                    gadget = state.record(gadget_name, func, dependencies, converters, own, own_lines)
+                    if state.fits(name, gadget):
+                        #memoize the gadget for fast track return the next time we see it in another branch
+                        all_gadgets[gadget_name] = gadget
+                        state.note_found(tried)
+                        return gadget
+            finally:
+                state.bound -= added
+
+    state.note_failed(tried)
     return None #could be due to a gadget requiring an unknown gadget
 
 
+#runs a search for the requested gadget name, and updates last_search with the report
+def _search(name: str, gadget_mapping: 'dict[str, _FunctionType]', gadget_type: str) -> 'models.GadgetBase | None':
+    global last_search
+
+    #known profiles are answered by the table right away, unless we are after the cheapest chain to run instead of the shortest
+    if _set_config['table'] and _set_config['order'] != 'runtime':
+        started = _time.perf_counter()
+        entry = _set_config['table'].lookup(name, _set_config)
+        if entry is not None:
+            gadget = None
+            if entry['feasible']:
+                from .utils.profiles import chain_from_spec
+                gadget_class = models.PythonGadgetInline if gadget_type == 'python' and _set_config['inline'] else models.gadget_type_mapping[gadget_type]
+                gadget = chain_from_spec(entry['spec'], gadget_class, models.converter_type_mapping[gadget_type])
+            last_search = SearchReport(name, 'found' if gadget else 'exhausted', gadget is not None, 0, (_time.perf_counter() - started) * 1000, from_table=True)
+            return gadget
+
+    state = _SearchState(name, gadget_type)
+    tracer = state.tracer
+    if tracer:
+        tracer.emit('search_start', 0, gadget=name, gadget_type=gadget_type)
+
+    #make a copy of the cached gadget_mapping so we can modify it with searched gadgets for memoization
+    #XXX the search stops at the first complete chain, so there is never a better complete chain to return when a budget runs out
+    state.start(dict(gadget_mapping))
+    gadget_class, converter_class = state.gadget_class, state.converter_class
+    #when probing a jail the config usually only gets stricter one step at a time, so pick up from the last search of the gadget if possible
+    previous = _solves.pop((gadget_type, name), None)
+    resumed = previous is not None and previous[1] == models.catalog_version and state.resume(previous[2], previous[0])
+    if tracer and resumed:
+        tracer.emit('search_resumed', 0, gadget=name, reused=len(state.records))
+    try:
+        state.run()
+        #only the found chain is ever turned into models
+        gadget = state.build(state.result, gadget_class, converter_class) if state.result is not None else None
+        stop_reason = 'found' if gadget else 'incomplete' if state.incomplete else 'exhausted'
+    except _BudgetExhausted as e:
+        gadget = None
+        stop_reason = e.args[0]
+
+    if resumed and stop_reason in ['exhausted', 'incomplete']:
+        #suggestions need the failures that were reused, search again from scratch for them
+        return _search(name, gadget_mapping, gadget_type)
+    if gadget:
+        #the models are the caller's now, only the records are needed
+        state.built = {}
+        _solves[gadget_type, name] = ({**_set_config, 'provided': list(_set_config['provided']), 'banned': list(_set_config['banned'])}, models.catalog_version, state)
+
+    if state.learning:
+        state.learning.flush()
+    last_search = SearchReport(name, stop_reason, gadget is not None, state.expansions, (_time.perf_counter() - state.started) * 1000, resumed=resumed, pruned=state.pruned)
+    if gadget and _set_config['order'] == 'runtime' and _set_config['costs'] is not None:
+        last_search.runtime_cost = _set_config['costs'].chain_cost(gadget)
+    if not gadget and name in state.partials:
+        last_search.partial = state.materialize(name, gadget_class, converter_class, last_search.violations, last_search.missing)
+    elif not gadget and stop_reason == 'exhausted':
+        #rejected by the dependency graph without trying anything
+        last_search.missing.append(name)
+
+    if tracer:
+        tracer.emit('search_end', 0, gadget=name, found=gadget is not None, stop_reason=stop_reason, expansions=state.expansions)
+
+    #out of budget, suggest the closest chain we have instead
+    if stop_reason in ['deadline', 'max_expansions']:
+        return last_search.partial
+    return gadget
+
+
+#searches for every name in names, and puts them all into one payload with every gadget they share only put in once (see models.render_shared)
+#the names are searched one after another in one search state, so gadgets found for a name are reused for the names after it instead of searched again
+#which gadgets end up shared depends on the order the names are searched in, so every order (up to max_orders of them) is tried and the shortest payload is kept
+#returns the payload with every name bound (gadgets with params are bound as functions to call), or None with last_search reporting the name that failed
+def multi(names: 'list[str]', max_orders: int = 24) -> 'str | None':
+    global last_search
+
+    gadget_type = _set_config['gadget_type']
+    #XXX inline chains are already flat, but their temporaries are named after the gadget using them so they cannot be shared as is
+    assert gadget_type == 'python' and not _set_config['inline'], 'multi only supports non inline python gadgets'
+    gadget_mapping = all_gadgets[gadget_type]
+    names = list(dict.fromkeys(names))
+    if not names:
+        raise ValueError('multi needs at least one gadget name')
+    for name in names:
+        #see get_all_gadgets_in_repo XXX note
+        if not any(gadget_name.startswith(name) for gadget_name in gadget_mapping): raise NameError(f'gadget {name} not found!')
+
+    started = _time.perf_counter()
+    best, expansions, pruned = None, 0, 0
+    #one search as far as the tracer is concerned, however many orders are tried
+    tracer = _set_config['tracer']
+    if tracer:
+        tracer.emit('search_start', 0, gadget=', '.join(names), gadget_type=gadget_type)
+    for order in _itertools.islice(_itertools.permutations(names), max_orders):
+        state = _SearchState(order[0], gadget_type)
+        state.shared = True
+        state.all_gadgets = dict(gadget_mapping)
+        #the budgets are for the whole call, not for every order
+        if state.deadline is not None:
+            state.deadline = started + _set_config['deadline_ms'] / 1000
+        if state.max_expansions is not None:
+            state.max_expansions -= expansions
+        results = {}
+        try:
+            for name in order:
+                state.name = name
+                state.start(state.all_gadgets)
+                state.run()
+                if state.result is None:
+                    break
+                results[name] = state.result
+            stop_reason = 'found' if len(results) == len(order) else 'exhausted'
+        except _BudgetExhausted as e:
+            stop_reason = e.args[0]
+        expansions += state.expansions
+        pruned += state.pruned
+        if state.learning:
+            state.learning.flush()
+
+        if stop_reason != 'found':
+            #a name without a chain has none in any order, and a budget that ran out would run out again
+            if best is None:
+                last_search = SearchReport(state.name, stop_reason, False, expansions, (_time.perf_counter() - started) * 1000, pruned=pruned)
+                if state.name in state.partials:
+                    last_search.partial = state.materialize(state.name, state.gadget_class, state.converter_class, last_search.violations, last_search.missing)
+                elif stop_reason == 'exhausted':
+                    last_search.missing.append(state.name)
+                if tracer:
+                    tracer.emit('search_end', 0, gadget=', '.join(names), found=False, stop_reason=stop_reason, expansions=expansions)
+                return None
+            break
+
+        payload = models.render_shared([state.build(results[name], state.gadget_class, state.converter_class) for name in names])
+        if best is None or len(payload) < len(best):
+            best = payload
+
+    last_search = SearchReport(', '.join(names), 'found', True, expansions, (_time.perf_counter() - started) * 1000, pruned=pruned)
+    if state.max_len is not None and len(best) > state.max_len:
+        #every chain fits on its own, but not all of them together - other chains of the names might, but only the first that fits is tried for each
+        last_search.stop_reason, last_search.complete, last_search.violations = 'incomplete', False, {name: {'max_len': {len(best)}} for name in names}
+        best = None
+    if tracer:
+        tracer.emit('search_end', 0, gadget=', '.join(names), found=best is not None, stop_reason=last_search.stop_reason, expansions=expansions)
+    return best
+
+
+#gadget variants (in catalog order) of the configured gadget type (or gadget_type) that match a capability query, without searching for any chains, e.g.
+#  find(name='sys', char='_', versions=[12], platforms=['linux'], max_len=50) - variants giving sys without a _ in them, that run on 3.12 on linux, in at most 50 chars
+#restrictions are given the same way as config (except max_len, which is the size of the variant on its own), requires is gadget names every variant must require,
+#uses is the opposite of the restrictions (field -> values every variant must have, e.g. {'ast': [ast.Lambda]}) - see utils/index.py
+def find(name: str = None, requires: 'list[str]' = (), uses: dict = {}, max_len: int = None, gadget_type: str = None, **restrictions) -> 'list[str]':
+    gadget_type = gadget_type or _set_config['gadget_type']
+    if gadget_type not in all_gadgets: raise NameError(f"gadget type {gadget_type} does not exist!")
+    return _get_index(gadget_type).find(name, requires, uses, max_len, **restrictions)
+
+
 del __path__  #prevent __getattr__ from running twice
 
 #chain searcher, only runs if the name is not in scope
@@ -229,22 +1273,17 @@ def __getattr__(name):
     try:
         #enable from jailbreak import * syntax
         if name == '__all__':
-            return ['config', 'register_converter', 'register_user_gadget', 'converters', 'utils', 'gadgets', 'models']
-
-        #look for the right type of gadgets and its gadgets dict
-        found = False
-        for gadget_type, gadget_mapping in all_gadgets.items():
-            for gadget_name in gadget_mapping:
-                if gadget_name.startswith(name):  #see get_all_gadgets_in_repo XXX note
-                    found = True
-                    break
-            if found:
-                break
+            return ['config', 'register_converter', 'register_user_gadget', 'unregister_user_gadget', 'converters', 'utils', 'gadgets', 'models', 'last_search', 'SearchReport', 'infer_restrictions', 'multi', 'find']
 
-        if not found: raise NameError(f'gadget {name} not found!')
-        
-        #make a copy of the cached gadget_mapping so we can modify it with searched gadgets for memoization
-        return _try_gadget(name, dict(gadget_mapping), [], gadget_type)
+        #look for the gadget in the configured type of gadgets, names can exist in multiple types (e.g. get_shell)
+        gadget_type = _set_config['gadget_type']
+        if gadget_type not in all_gadgets: raise NameError(f"gadget type {gadget_type} does not exist!")
+        gadget_mapping = all_gadgets[gadget_type]
+
+        #see get_all_gadgets_in_repo XXX note
+        if not any(gadget_name.startswith(name) for gadget_name in gadget_mapping): raise NameError(f'gadget {name} not found!')
+
+        return _search(name, gadget_mapping, gadget_type)
     except Exception as e:
         import traceback
-        traceback.print_exc()
\ No newline at end of file
+        traceback.print_exc()
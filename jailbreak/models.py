@@ -7,13 +7,17 @@ They form the core of the payload generator, with the following goals in mind:
  - Should preserve compatility with on-the-fly chain generations e.g. via dependency traversal (the current mechanism of the payload generator)
  - Should be abstract enough that all types of pyjail payloads (e.g. python, pickle, bytecode) can be specified by mostly the same mechanism and be compatible with the payload generator
  - Should be reusable, i.e. the same gadget instance can exist in multiple paths (e.g. for optimization via memoization)
- - Should track possible paths even if they are incomplete, e.g. with missing gadgets or has violations (TODO)
-   - Should suggest paths based on heuristics such as least amount of violations / most gadgets in chain (TODO)
+ - Should track possible paths even if they are incomplete, e.g. with missing gadgets or has violations
+   - Should suggest paths based on heuristics such as least amount of violations / most gadgets in chain
+     (the traverser suggests the partial chain with the least violations + missing gadgets, see `SearchReport` in [`__init__.py`](jailbreak/__init__.py))
 
 To make a new gadget type, perfrom the following:
  - extend ConverterBase and GadgetBase, add required data and implement the respective functions
  - add the new converter class and gadget class to the respective type_mapping
  - in [`__init__.py`](jailbreak/__init__.py), create a new `_count_violations` function for the type that checks for violation type that applies to the gadget type and add it to `_count_violations_mapping`
+   - for the feasibility prefilter, split it into an `_extract_features` function (added to `_extract_features_mapping`) and matchers for each field (added to `_matchers_mapping`)
+ - register converters for the type with `@register_converter(..., gadget_type=<type>)`
+ - add a directory for the gadgets of the type in gadgets/
 
 NOTE: The models do not perform any checks on whether the generated code conforms to restrictions nor whether it works -
       it is assumed that given chain specification is correct.
@@ -21,29 +25,73 @@ NOTE: The models do not perform any checks on whether the generated code conform
 
 from dataclasses import dataclass as _dataclass, field as _field
 from types import FunctionType as _FunctionType
-import ast as _ast, inspect as _inspect, copy as _copy, os as _os, importlib as _importlib
+import ast as _ast, inspect as _inspect, copy as _copy, os as _os, importlib as _importlib, weakref as _weakref, re as _re, pickle as _pickle, pickletools as _pickletools, io as _io
 
 #
 # Configuration interfaces
 #
 
 registered_converters = {}  #mapping of converter function -> list of types of data to apply to (e.g. specific AST nodes)
+converter_gadget_types = {}  #mapping of converter function -> gadget type it converts
 #TODO wildcard converters
 applicable_converters = {}  #violation type -> { violation node -> converter function }
 
 
-set_config = {'restrictions': {}, 'provided': [], 'banned': [], 'inline': False}
+set_config = {'restrictions': {}, 'provided': [], 'banned': [], 'inline': False, 'tracer': None, 'deadline_ms': None, 'max_expansions': None, 'order': 'catalog', 'gadget_type': 'python', 'table': None, 'max_len': None, 'costs': None, 'dominance': True, 'learning': False}
 
 def config(**kwargs):
     global set_config
 
+    #checked before anything is set, so a bad config leaves the previous one as is
+    if kwargs.get('order', 'catalog') not in ['catalog', 'graph', 'runtime']:
+        raise ValueError(f"order must be one of 'catalog', 'graph' or 'runtime', not {kwargs['order']!r}")
+    if kwargs.get('order') == 'runtime' and kwargs.get('costs') is None:
+        raise ValueError("order='runtime' needs the runtime costs of the gadgets, e.g. costs=jailbreak.utils.runtime.RuntimeCosts(<path>)")
+
     #put these in another field since they are not restrictions
     set_config['provided'] = kwargs.pop('provided', [])
     set_config['banned'] = kwargs.pop('banned', [])
     set_config['inline'] = kwargs.pop('inline', False)
+    set_config['tracer'] = kwargs.pop('tracer', None)  #see utils/tracer.py
+    #search budgets, the search stops with the closest partial chain once either runs out
+    set_config['deadline_ms'] = kwargs.pop('deadline_ms', None)
+    set_config['max_expansions'] = kwargs.pop('max_expansions', None)
+    #order to try gadget variants in: 'catalog' (the order they are defined in), 'graph' (cheapest acyclic variants first, see utils/depgraph.py)
+    #or 'runtime' (acyclic variants with the lowest estimated runtime of their chain first, by the costs below)
+    set_config['order'] = kwargs.pop('order', 'catalog')
+    #measured runtime costs of the gadgets for order='runtime', see utils/runtime.py
+    set_config['costs'] = kwargs.pop('costs', None)
+    #skip gadget variants that a sibling variant is at least as good as under the restrictions, see utils/dominance.py
+    set_config['dominance'] = kwargs.pop('dominance', True)
+    #statistics of past searches to try the variants most likely to work first, or False to keep the order deterministic, see utils/learning.py
+    set_config['learning'] = kwargs.pop('learning', False)
+    #type of gadgets to search for, e.g. 'python' or 'pickle' (see gadgets/)
+    set_config['gadget_type'] = kwargs.pop('gadget_type', 'python')
+    #precomputed lookup table for known profiles, see utils/profiles.py
+    set_config['table'] = kwargs.pop('table', None)
+    #maximum length of the payload (with the param names as the params), chains that cannot fit are pruned while searching
+    set_config['max_len'] = kwargs.pop('max_len', None)
 
     set_config['restrictions'] = kwargs
 
+    for hook in config_hooks:
+        hook(set_config)
+
+#functions to call with the new set_config after every config() call, for precomputing anything that depends on it
+config_hooks = []
+
+#functions to call with (gadget type, gadget name, gadget func or None if removed) whenever the gadget catalog changes, for updating anything derived from it
+catalog_hooks = []
+
+#functions to call with (converter func, whether it was registered or removed) whenever the registered converters change
+converter_hooks = []
+
+#bumped on every gadget catalog or converter change, for telling whether anything derived from the catalog is stale
+catalog_version = 0
+
+def _catalog_changed():
+    global catalog_version
+    catalog_version += 1
 
 #for adding custom gadgets by the user
 def register_user_gadget(func, gadget_type):
@@ -52,6 +100,18 @@ def register_user_gadget(func, gadget_type):
     else:
         raise NameError(f"gadget type {gadget_type} does not exist!")
 
+    _catalog_changed()
+    for hook in catalog_hooks:
+        hook(gadget_type, func.__name__, func)
+
+def unregister_user_gadget(name, gadget_type):
+    if gadget_type not in all_gadgets:
+        raise NameError(f"gadget type {gadget_type} does not exist!")
+    if all_gadgets[gadget_type].pop(name, None):
+        _catalog_changed()
+        for hook in catalog_hooks:
+            hook(gadget_type, name, None)
+
 
 #for use as decorator on converters
 #XXX currently implicitly assumes a violation type will be bound to a specific type of converter (e.g. PythonConverter for AST nodes)
@@ -60,7 +120,7 @@ def register_user_gadget(func, gadget_type):
 #TODO figure out some way to key this (either via directory mapping similar to gadgets, manual typing, or better implicit conversion)
 #     current thought: reconciling gadget and converter structures seem better for parsing, but might be clunky for converters
 #     since theres not that many for each type compared to gadgets
-def register_converter(*nodes, **violations):
+def register_converter(*nodes, gadget_type='python', **violations):
     def apply(converter):
         for type, list in violations.items():
             type_violations = {} if type not in applicable_converters else applicable_converters[type]
@@ -74,10 +134,31 @@ def register_converter(*nodes, **violations):
             applicable_converters[type] = type_violations
 
         registered_converters[converter] = nodes
+        converter_gadget_types[converter] = gadget_type
+
+        _catalog_changed()
+        for hook in converter_hooks:
+            hook(converter, True)
         return converter
 
     return apply
 
+#removes a converter registered via @register_converter, e.g. the old version of a reloaded converter
+def unregister_converter(converter):
+    if converter not in registered_converters:
+        return
+
+    for type_violations in applicable_converters.values():
+        for violation, converters in list(type_violations.items()):
+            if converter in converters:
+                converters.remove(converter)
+    del registered_converters[converter]
+    del converter_gadget_types[converter]
+
+    _catalog_changed()
+    for hook in converter_hooks:
+        hook(converter, False)
+
 #
 # End configuration interfaces
 #
@@ -116,7 +197,7 @@ def get_all_gadgets_in_repo() -> 'dict[str, dict[str, _FunctionType]]':
 
     return all_gadgets
 
-#XXX this doesnt update if any new gadgets show up until you reload the module but i dont think ppl would do that
+#XXX this doesnt update if any new gadgets show up until you reload the module, unless the catalog is watched (see utils/watcher.py)
 all_gadgets = get_all_gadgets_in_repo()   #cache the gadgets for use
 
 
@@ -171,6 +252,121 @@ class ApplyConverter(_ast.NodeTransformer):
         return super().generic_visit(node)
 
 
+#ast walker for applying several converters in one traversal, gives the same result as running ApplyConverter for each of them one after another
+#a node is given to the converters that apply to its type in order, and each converter only goes on to the children of the nodes it returned (same as ApplyConverter)
+#a converter sees the node after the earlier converters are done with it and its whole subtree, since that is when it would see it if they were run one after another
+#NOTE this assumes converters only look at the node they are given and the path to it (and not at e.g. siblings of the node), which is what the path is for anyway
+class ApplyConverters:
+    #dispatch tables of the converter sets seen so far; converter funcs -> (converters callable without their gadgets, node type -> indices of the converters applying to it)
+    #only kept for the current catalog_version, so converters that were reloaded or removed (and their globals) are not kept alive by the tables
+    _tables: 'dict[tuple[_FunctionType], tuple[list, dict]]' = {}
+    _tables_version = None
+
+    def __init__(self, converters: 'list[_FunctionType]') -> None:
+        if ApplyConverters._tables_version != catalog_version:
+            ApplyConverters._tables.clear()
+            ApplyConverters._tables_version = catalog_version
+        key = tuple(converters)
+        if key not in self._tables:
+            dispatch = {}
+            for i, converter in enumerate(converters):
+                for node_type in registered_converters[converter]:
+                    dispatch.setdefault(node_type, []).append(i)
+            #same as ApplyConverter, change the converters so that the gadgets in kwonlyargs are not required to call them
+            self._tables[key] = ([_FunctionType(c.__code__.replace(co_kwonlyargcount=0), c.__globals__) for c in converters], dispatch)
+        self.converters, self.dispatch = self._tables[key]
+
+        #nodes from the top level to the current node - either the node, or (converter index, node) pairs for nodes replaced along the way
+        #so every converter gets the nodes as it would have seen them
+        self.curr_path = []
+        #nodes returned by the converters, which get their missing locations fixed on their own (see _fix_locations)
+        self.replaced = set()
+
+    def visit(self, node: _ast.AST) -> _ast.AST:
+        node = self._visit(node, 0, len(self.converters) - 1, None, None)
+        #once over the whole tree instead of for every replaced node
+        if self.replaced:
+            self._fix_locations(node, 1, 0, 1, 0, False)
+        return node
+
+    #the path as seen by converter i
+    def _path(self, i: int) -> list:
+        return [entry if not isinstance(entry, list) else [node for first, node in entry if first <= i][-1] for entry in self.curr_path]
+
+    #runs converters lo to hi on node and its subtree; parent and field are where the node is in its parent, which is kept up to date for the converters
+    def _visit(self, node: _ast.AST, lo: int, hi: int, parent, field) -> _ast.AST:
+        self.curr_path.append(node)
+        start = lo   #converters from start on have not gone into the children yet
+        i = lo
+        #most nodes have no converter applying to them at all
+        while type(node) in self.dispatch:
+            applies = [c for c in self.dispatch[type(node)] if i <= c <= hi]
+            if not applies:
+                break
+            i = applies[0]
+
+            #the earlier converters go through the children first
+            if i > start:
+                self._visit_children(node, start, i - 1)
+            if not isinstance(self.curr_path[-1], list):
+                self.curr_path[-1] = [(lo, node)]
+            node = self.converters[i](self._path(i))
+            self.curr_path[-1].append((i + 1, node))
+            self.replaced.add(node)
+            if isinstance(parent, list):
+                parent[field] = node
+            elif parent is not None:
+                setattr(parent, field, node)
+            start = i
+            i += 1
+
+        self._visit_children(node, start, hi)
+        self.curr_path.pop()
+        return node
+
+    #same as NodeTransformer.generic_visit
+    def _visit_children(self, node: _ast.AST, lo: int, hi: int):
+        for field, old_value in _ast.iter_fields(node):
+            if isinstance(old_value, list):
+                for j, value in enumerate(old_value):
+                    if isinstance(value, _ast.AST):
+                        old_value[j] = self._visit(value, lo, hi, old_value, j)
+            elif isinstance(old_value, _ast.AST):
+                setattr(node, field, self._visit(old_value, lo, hi, node, field))
+
+    #same as ast.fix_missing_locations, but only inside the nodes returned by converters, which start over from line 1 col 0 like ApplyConverter fixing each of them on their own does
+    def _fix_locations(self, node: _ast.AST, lineno: int, col_offset: int, end_lineno: int, end_col_offset: int, inside: bool):
+        if node in self.replaced:
+            lineno, col_offset, end_lineno, end_col_offset, inside = 1, 0, 1, 0, True
+        if not inside:
+            for child in _ast.iter_child_nodes(node):
+                self._fix_locations(child, lineno, col_offset, end_lineno, end_col_offset, inside)
+            return
+
+        if 'lineno' in node._attributes:
+            if not hasattr(node, 'lineno'):
+                node.lineno = lineno
+            else:
+                lineno = node.lineno
+        if 'end_lineno' in node._attributes:
+            if getattr(node, 'end_lineno', None) is None:
+                node.end_lineno = end_lineno
+            else:
+                end_lineno = node.end_lineno
+        if 'col_offset' in node._attributes:
+            if not hasattr(node, 'col_offset'):
+                node.col_offset = col_offset
+            else:
+                col_offset = node.col_offset
+        if 'end_col_offset' in node._attributes:
+            if getattr(node, 'end_col_offset', None) is None:
+                node.end_col_offset = end_col_offset
+            else:
+                end_col_offset = node.end_col_offset
+        for child in _ast.iter_child_nodes(node):
+            self._fix_locations(child, lineno, col_offset, end_lineno, end_col_offset, inside)
+
+
 #convert all calls into inlined code
 #ast walker for applying given converters
 #TODO check if theres ever any case where the dependent gadgets are not immediately used (i dont think so?)
@@ -287,13 +483,155 @@ class Inliner(_ast.NodeTransformer):
         return super().generic_visit(node)
 
 
+#copies an ast tree like copy.deepcopy, except subtrees that appear more than once (e.g. from ASTStore) are copied separately
+#so that the copy is a proper tree that can be modified in place (and marked by asttokens) safely
+def _copy_tree(node):
+    if isinstance(node, list):
+        return [_copy_tree(n) for n in node]
+    if not isinstance(node, _ast.AST):
+        return node
+
+    new = type(node)()
+    for attr, value in vars(node).items():
+        setattr(new, attr, _copy_tree(value))
+    return new
+
+
+#hash-consing store for ast trees - structurally identical subtrees are replaced with a single canonical node,
+#so identical converted gadgets and chain fragments shared by multiple gadgets only exist once in memory
+#entries are weak references, so the store only holds on to nodes that are still used by a gadget
+#NOTE interned trees are shared and must never be modified in place, use _copy_tree to get a modifiable copy first
+class ASTStore:
+    def __init__(self) -> None:
+        self._nodes = _weakref.WeakValueDictionary()  #structural key -> canonical node
+        self._ids = _weakref.WeakKeyDictionary()      #canonical node -> id used in the keys of its parents (never reused, unlike id())
+        self._counter = 0
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def _value_key(self, value):
+        #-0.0 == 0.0 and 1 == 1.0 == True, but they are different code
+        if isinstance(value, (tuple, frozenset)):
+            return (type(value), type(value)(self._value_key(v) for v in value))
+        if isinstance(value, (float, complex)):
+            return (type(value), repr(value))
+        return (type(value), value)
+
+    #returns the canonical tree for tree, the nodes of tree are reused (and modified) to build it so tree should not be used afterwards
+    def intern(self, tree: _ast.AST) -> _ast.AST:
+        canonical = {}  #id(node) -> canonical node, for the nodes of tree
+
+        #post order so the children are canonical before their parent is looked up, iterative since chains nest deep
+        stack = [(tree, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if node in self._ids or id(node) in canonical and not children_done:
+                canonical[id(node)] = node if node in self._ids else canonical[id(node)]
+                continue
+
+            fields = [(f, getattr(node, f, None)) for f in node._fields]
+            if not children_done:
+                stack.append((node, True))
+                for _, value in fields:
+                    for child in (value if isinstance(value, list) else [value]):
+                        if isinstance(child, _ast.AST):
+                            stack.append((child, False))
+                continue
+
+            key = [type(node)]
+            for f, value in fields:
+                if isinstance(value, list):
+                    value = [canonical[id(v)] if isinstance(v, _ast.AST) else v for v in value]
+                    setattr(node, f, value)
+                    key.append(tuple(self._ids[v] if isinstance(v, _ast.AST) else self._value_key(v) for v in value))
+                elif isinstance(value, _ast.AST):
+                    value = canonical[id(value)]
+                    setattr(node, f, value)
+                    key.append(self._ids[value])
+                else:
+                    key.append(self._value_key(value))
+            key = tuple(key)
+
+            if key not in self._nodes:
+                self._nodes[key] = node
+                self._ids[node] = self._counter
+                self._counter += 1
+            canonical[id(node)] = self._nodes[key]
+
+        return canonical[id(tree)]
+
+#shared by all gadgets, so identical code from different searches (or profiles) is also only kept once
+ast_store = ASTStore()
+
+
+#dataclass decorator for the models - slots to keep instances small and quick to make, since a search can make a lot of them
+#slots=True makes a new class, so methods using zero argument super() would still refer to the old class via their __class__ cell; point them to the new one
+def _model(cls):
+    slotted = _dataclass(eq=False, slots=True)(cls)
+    for value in vars(slotted).values():
+        func = getattr(value, '__func__', value)
+        if isinstance(func, _FunctionType) and func.__closure__:
+            for var, cell in zip(func.__code__.co_freevars, func.__closure__):
+                if var == '__class__' and cell.cell_contents is cls:
+                    cell.cell_contents = slotted
+    return slotted
+
+
+#write function for streaming a payload into fp - binary streams get python payloads as utf-8, text streams get pickle payloads as latin-1 (one char per byte)
+def _stream_writer(fp, data_is_bytes: bool):
+    binary = isinstance(fp, (_io.RawIOBase, _io.BufferedIOBase)) or 'b' in getattr(fp, 'mode', '')
+    if binary == data_is_bytes:
+        return fp.write
+    return (lambda data: fp.write(data.decode('latin-1'))) if data_is_bytes else (lambda data: fp.write(data.encode()))
+
+#ast.unparse, except the source is written out as it goes instead of joined into one string at the end
+#the text so far is flushed at the start of a statement once there is at least chunk chars of it, so only about one statement is held at a time
+#NOTE this relies on the internals of ast._Unparser (all output goes through write, and maybe_newline checks whether anything was written yet)
+class _StreamingUnparser(_ast._Unparser):
+    #f-strings are unparsed by a new unparser of the same type (with kwargs), which just works like ast.unparse since it has no write
+    def __init__(self, write=None, chunk: int = 1 << 16, **kwargs):
+        super().__init__(**kwargs)
+        self._write = write
+        self._chunk = chunk
+        self._out = None
+        self._size = 0
+        self._written = False
+
+    def write(self, *text):
+        self._source.extend(text)
+        #not counting what goes into a temporary buffer (see _Unparser.buffered), that is written again once it is done
+        if self._source is self._out:
+            self._size += sum(map(len, text))
+
+    def maybe_newline(self):
+        if self._source or self._written:
+            self.write('\n')
+
+    def fill(self, text=''):
+        if self._size >= self._chunk and self._source is self._out:
+            self.flush()
+        super().fill(text)
+
+    def flush(self):
+        if self._source:
+            self._write(''.join(self._source))
+            self._written = True
+            self._source[:] = []
+            self._size = 0
+
+    def stream(self, node: _ast.AST):
+        self._source = self._out = []
+        self.traverse(node)
+        self.flush()
+
 #
 # End utility functions/classes
 #
 
 
 #common base for both converters and gadgets
-@_dataclass(eq=False)
+@_model
 class ModelBase:
     #a gadget should either have a func passed to it, or a name that it would infer the func from
     #NOTE: func should not change even if it is rewritten
@@ -304,8 +642,6 @@ class ModelBase:
     dependencies: 'list[GadgetBase]' = _field(default_factory=list)
     dummy: bool = _field(default=False)
 
-    #TODO some mechanism to track failed gadget chains for giving partial suggestions
-
     #convert the gadget into a dummy gadget - child classes should override it to provide dummy data for their respective types
     def _make_dummy(self):
         def dummy(): pass
@@ -349,7 +685,7 @@ class ModelBase:
 
 
 #documents a gadget
-@_dataclass(eq=False)
+@_model
 class GadgetBase(ModelBase):
     #gadgets have converters
     converters: 'list[ConverterBase]' = _field(default_factory=list)
@@ -358,11 +694,19 @@ class GadgetBase(ModelBase):
     def __call__(self, *args, **kwargs):
         assert False, "gadget call not implemented"
 
+    #same as __call__, but writes the payload into fp (a text or binary stream) bit by bit instead of returning it all at once
+    #child classes should override it to avoid holding the whole payload in memory
+    def render_to(self, fp, *args):
+        payload = self(*args)
+        _stream_writer(fp, isinstance(payload, bytes))(payload)
+
     def _transform_data(self):
         #run apply_converters on the uninitialized converters
+        #most gadgets are built without any, skip copying the data just to put it back as is then
         converters = self.converters
         self.converters = []
-        self.apply_converters(converters)
+        if converters:
+            self.apply_converters(converters)
         #before deps
         super()._transform_data()
 
@@ -393,14 +737,14 @@ class GadgetBase(ModelBase):
     def apply_converters(self, converters: 'list[ConverterBase]', data = None):
         if not data:
             data = self.extract()
-            for converter in converters:
-                data = converter.convert(data, self)
+            if converters:
+                data = type(converters[0]).convert_all(converters, data, self)
         self.converters += converters
         return data
 
 
 #documents an converter
-@_dataclass(eq=False)
+@_model
 class ConverterBase(ModelBase):
     #what data this converter applies to
     applies: list = _field(init=False, repr=False)
@@ -432,19 +776,35 @@ class ConverterBase(ModelBase):
     def convert(self, data, gadget: 'GadgetBase'):
         pass
 
+    #converts data with every converter in converters in order, same as running convert on each of them one after another
+    #child classes can override it to do it in one go
+    @classmethod
+    def convert_all(cls, converters: 'list[ConverterBase]', data, gadget: 'GadgetBase'):
+        for converter in converters:
+            data = converter.convert(data, gadget)
+        return data
+
 
 
 #documents a python converter
-@_dataclass(eq=False)
+@_model
 class PythonConverter(ConverterBase):
     def convert(self, data: _ast.AST, gadget: 'PythonGadget'):
         #clean docstrings off data first to avoid unnecessary conversions / false positives (since the docstrings will no longer match the one in orig_ast)
         gadget.remove_docstring(data)
         return ApplyConverter(self.func, self.applies).visit(data)
 
+    #override: all converters in one traversal (see ApplyConverters)
+    @classmethod
+    def convert_all(cls, converters: 'list[PythonConverter]', data: _ast.AST, gadget: 'PythonGadget'):
+        if not converters:
+            return data
+        gadget.remove_docstring(data)
+        return ApplyConverters([converter.func for converter in converters]).visit(data)
+
 
 #documents a python gadget
-@_dataclass(eq=False)
+@_model
 class PythonGadget(GadgetBase):
     #ast funcs is generated automatically and has no useful info (no repr), ignore
     #original gadget ast, will never change
@@ -457,6 +817,11 @@ class PythonGadget(GadgetBase):
     #setting this field should be done by specifying the class instead, hence init=False and repr=False
     inline: bool = _field(init=False, repr=False, default=False)
 
+    #chains are spliced lazily - gadgets whose code still has to be put into chain_ast, in order (see _splice_pending)
+    _pending: list = _field(init=False, repr=False, default_factory=list)
+    #cached result of _full_ast, reused by every gadget depending on this one until this gadget changes
+    _fragment: _ast.AST = _field(init=False, repr=False, default=None)
+
     #create a dummy gadget that returns a commented out func def
     def _make_dummy(self):
         super()._make_dummy()
@@ -471,8 +836,11 @@ class PythonGadget(GadgetBase):
     def __post_init__(self):
         super().__post_init__()
         if not self.dummy:
-            self.func_ast = _ast.parse(_inspect.getsource(self.func).strip())  #strip to accomodate for nested function sources (e.g. the one at create_dummy_gadget)
-            self.orig_ast = _copy.deepcopy(self.func_ast)
+            #strip to accomodate for nested function sources (e.g. the one at create_dummy_gadget)
+            #interned so that every instance of the same gadget shares one tree
+            self.orig_ast = ast_store.intern(_ast.parse(_inspect.getsource(self.func).strip()))
+            #inlined gadgets modify func_ast in place when chaining, so they need their own copy
+            self.func_ast = _copy_tree(self.orig_ast) if self.inline else self.orig_ast
             self.chain_ast = _ast.Module([], []) if not self.inline else self.func_ast #empty container if not inline else same ref as func_ast coz the chain directly modifies the func_ast
 
             self._transform_data()
@@ -515,6 +883,7 @@ class PythonGadget(GadgetBase):
             #print(f'orig\n{_ast.unparse(func_ast)}')
             func_ast = Inliner(code_ast.body[0].name, code_ast.body[0]).visit(func_ast)
             #print(f'rewritten\n{_ast.unparse(func_ast)}\n\n')
+            return _ast.fix_missing_locations(func_ast)
         else:
             body = code_ast.body
             if code_ast_is_func:
@@ -529,8 +898,9 @@ class PythonGadget(GadgetBase):
             else:
                 func_ast.body = body + func_ast.body  #inlined, just add to the front
 
-            
-        return _ast.fix_missing_locations(func_ast)
+        #no new nodes other than the ones _ready_gadget_for_use already fixed, and the spliced code is fixed on its own
+        #so there is no need to fix the whole chain again (which made chaining quadratic in the chain size)
+        return func_ast
 
     #NOTE: modifies ast
     def remove_docstring(self, ast):
@@ -546,10 +916,26 @@ class PythonGadget(GadgetBase):
 
     #merges the func ast and the chain ast together
     #this also removes some gadget metadata thats for internal use, so is functionally similar to _ready_gadget_for_use, except this gives a raw function gadget
+    #the result is the caller's to modify, see _full_ast for the shared one
     def get_full_ast(self) -> _ast.Module:
+        return _copy_tree(self._full_ast())
+
+    #same as get_full_ast, but the result is shared (cached) for non inline gadgets, so it must not be modified in place
+    def _full_ast(self) -> _ast.Module:
+        #inlined chains are modified in place when spliced into others, so they always need a fresh one
+        if self.inline:
+            return self._render_full_ast()
+        if self._fragment is None:
+            self._fragment = ast_store.intern(self._render_full_ast())
+        return self._fragment
+
+    #chain replaces chain_ast if given, e.g. with only some of the dependencies in it (see render_shared)
+    def _render_full_ast(self, chain: _ast.Module = None) -> _ast.Module:
+        self._splice_pending()
+
         #make a new ast node to stuff into; this shouldnt take too long since func_ast is small (just the gadget) while chain_ast could be big (the whole chain)
-        #XXX deepcopy is slow even on func_ast for inline = True since func_ast == chain_ast
-        full_ast = _copy.deepcopy(self.func_ast)
+        #XXX copying is slow even on func_ast for inline = True since func_ast == chain_ast
+        full_ast = _copy_tree(self.func_ast)
 
         #could be Expr for dummy gadgets
         if isinstance(full_ast.body[0], _ast.FunctionDef):
@@ -564,19 +950,33 @@ class PythonGadget(GadgetBase):
 
         #if we are inlining func_ast == chain_ast anyways due to how the chain modifies func_ast directly so dont put code in
         if not self.inline:
-            self._put_code_into_func_body(full_ast, self.chain_ast)
+            self._put_code_into_func_body(full_ast, self.chain_ast if chain is None else chain)
         return full_ast
         
 
     #terminator call (i.e. the user facing part), get the whole src of the gadget
     def __call__(self, *args):
+        payload, call = self._payload_ast(args)
+        return _ast.unparse(payload) + call + '\n'
+
+    #same as __call__, but the payload is unparsed straight into fp (see _StreamingUnparser), with the cached renderings of the chains as they are
+    #so only the ast (which is mostly shared with the chains anyway) and about one statement of source are in memory at a time, instead of the whole payload source
+    #XXX inline gadgets with params still go through the source once (see _payload_ast)
+    def render_to(self, fp, *args):
+        write = _stream_writer(fp, False)
+        payload, call = self._payload_ast(args)
+        _StreamingUnparser(write).stream(payload)
+        write(call + '\n')
+
+    #ast of the payload, and the call to the gadget with args to add to the end of its source (empty if there is none)
+    def _payload_ast(self, args) -> 'tuple[_ast.Module, str]':
         if self.dummy:  #no need to process much, just grab the ast
-            return _ast.unparse(self.func_ast) + '\n'
+            return self.func_ast, ''
 
         params = _inspect.getfullargspec(self.func).args
         _, name = self._get_gadget_names_from_ast(self.func_ast)
         #use _put_code_into_func_body instead of _ready_gadget_for_use here since the former also does simple inlining cases
-        full_ast = self.get_full_ast()
+        full_ast = self._full_ast()
 
         #for complex inline cases, we need to add a reference before we put code into func body and trigger inliner so the code is generated correctly
         #without a reference, inliner will assume the function is never used and return an empty gadget
@@ -586,43 +986,114 @@ class PythonGadget(GadgetBase):
             full_ast = _ast.parse(chain_src)
 
         #_put_code_into_func_body deals with cleaning up the function via _ready_gadget_for_use, and handles both simple and complex inlining cases if needed
-        src = _ast.unparse(self._put_code_into_func_body(_ast.Module([], []), full_ast))
+        payload = self._put_code_into_func_body(_ast.Module([], []), full_ast)
 
         #for non inline cases only (simple inline cases does not have params), we can add it to the src directly after
-        if params and not self.inline:
-            src += f'\n{name}({", ".join(args)})'
-        
-        return src + '\n'
+        return payload, f'\n{name}({", ".join(args)})' if params and not self.inline else ''
 
     
-    #override: also put code into our func_ast
+    #override: also put code into our func_ast (lazily, once the chain is needed)
     def add_dependency(self, dependency: 'PythonGadget'):
         super().add_dependency(dependency)
-        self._put_code_into_func_body(self.chain_ast, dependency.get_full_ast())
+        self._pending.append(dependency)
+        self._fragment = None
+
+    #puts the code of the pending gadgets into chain_ast, in the order they were added
+    def _splice_pending(self):
+        pending, self._pending = self._pending, []
+        for dep in pending:
+            #assume the dependencies are of the same effective class - its hard to check if theyre subclasses of each other
+            self._put_code_into_func_body(self.chain_ast, self._intern_chain(dep._full_ast()))
     
     #override: extract func_ast for python gadgets
     def extract(self):
-        return _copy.deepcopy(self.func_ast)
+        self._splice_pending()
+        return _copy_tree(self.func_ast)
+
+    #chains are only ever modified in place when inlining, so the other chains can be shared with every gadget that depends on them
+    def _intern_chain(self, ast: _ast.Module) -> _ast.Module:
+        return ast if self.inline else ast_store.intern(ast)
 
     #override: basically same thing as add_dependency, but we directly put code from the converter dependencies into ours
     def apply_converters(self, converters: 'list[ConverterBase]', data: _ast.AST = None):
         #replace func_ast with the new data we computed
-        self.func_ast = super().apply_converters(converters, data)
+        self.func_ast = self._intern_chain(super().apply_converters(converters, data))
 
         if self.inline:
             self.chain_ast = self.func_ast  #also need to update chain_ast's reference to use the new one
+            self._pending = []  #anything spliced into the old func_ast is gone along with it
         for converter in converters:
-            for dep in converter.dependencies:
-                #assume the dependencies are of the same effective class - its hard to check if theyre subclasses of each other
-                #the chain is basically cached already in dep.chain_ast, no need to worry about performance
-                self._put_code_into_func_body(self.chain_ast, dep.get_full_ast())
+            #the chain is basically cached already in the fragment of dep, no need to worry about performance
+            self._pending += converter.dependencies
+        self._fragment = None
 
         #for chaining if needed (very unlikely this will have child classes but for consistency since base class also returns data)
         return self.func_ast
 
 
+#renders several (non inline) python chains into one payload, with every gadget they share only put in once, and the requested gadgets bound to their names (see jailbreak.multi)
+#shared gadgets are put at the top level in dependency order, so the gadgets using them pick them up from there instead of having their own copy nested inside
+#only gadgets that are the only one for their name in all of the chains can go to the top level though, two different gadgets for the same name would clash
+#- those are nested into every gadget using them as usual, but still use the top level ones for their own dependencies
+def render_shared(gadgets: 'list[PythonGadget]') -> str:
+    #dependencies of a gadget, in the order they are spliced into its chain (see apply_converters)
+    chain_deps = lambda gadget: [dep for converter in gadget.converters for dep in converter.dependencies] + gadget.dependencies
+    bound_name = lambda gadget: gadget.name if gadget.dummy else gadget.name.split('__')[0]
+
+    #structural key of every gadget, since the same gadget can be in the chains as separate (but identical) models
+    keys: 'dict[int, tuple]' = {}
+    def key(gadget: PythonGadget) -> tuple:
+        if id(gadget) not in keys:
+            keys[id(gadget)] = (gadget.name, gadget.dummy, tuple((c.name, tuple(key(d) for d in c.dependencies)) for c in gadget.converters), tuple(key(d) for d in gadget.dependencies))
+        return keys[id(gadget)]
+
+    names: 'dict[str, set[tuple]]' = {}
+    seen, todo = set(), list(gadgets)
+    while todo:
+        gadget = todo.pop()
+        if key(gadget) not in seen:
+            seen.add(key(gadget))
+            names.setdefault(bound_name(gadget), set()).add(key(gadget))
+            todo += chain_deps(gadget)
+    shared = lambda gadget: len(names[bound_name(gadget)]) == 1
+
+    #full ast of a gadget with only the dependencies that are not shared nested in, the shared ones are in scope already
+    #(nothing in between binds a shared name, since the names bound on the way are the ones that are not shared)
+    rendered: 'dict[tuple, _ast.Module]' = {}
+    def render(gadget: PythonGadget) -> _ast.Module:
+        if gadget.dummy:
+            return gadget.func_ast
+        chain = _ast.Module([], [])
+        for dep in chain_deps(gadget):
+            if not shared(dep):
+                gadget._put_code_into_func_body(chain, rendered[key(dep)])
+        return gadget._render_full_ast(chain)
+
+    #post order so dependencies come before the gadgets using them (and are rendered before them), iterative since chains nest deep
+    body = []
+    for root in gadgets:
+        stack = [(root, False)]
+        while stack:
+            gadget, expanded = stack.pop()
+            if key(gadget) in rendered:
+                continue
+            if not expanded:
+                stack.append((gadget, True))
+                stack.extend((dep, False) for dep in reversed(chain_deps(gadget)))
+                continue
+            rendered[key(gadget)] = render(gadget)
+            if shared(gadget):
+                body.extend(gadget._put_code_into_func_body(_ast.Module([], []), rendered[key(gadget)]).body)
+
+    #requested gadgets that could not go to the top level still need to be bound
+    for gadget in {key(gadget): gadget for gadget in gadgets}.values():
+        if not shared(gadget):
+            body.extend(gadget._put_code_into_func_body(_ast.Module([], []), rendered[key(gadget)]).body)
+    return _ast.unparse(_ast.Module(body, [])) + '\n'
+
+
 #convenience class for creating inline python gadgets without declaring it every time
-@_dataclass(eq=False)
+@_model
 class PythonGadgetInline(PythonGadget):
     inline: bool = _field(init=False, repr=False, default=True)
     #override: force inline = True
@@ -633,11 +1104,104 @@ class PythonGadgetInline(PythonGadget):
 
 
 
+#documents a pickle converter
+#pickle converters rewrite the raw bytes of a gadget, one part at a time (see PickleGadget.data) so the spliced in gadgets are left alone
+#NOTE pickle converters cannot refer to other gadgets in the bytes they produce, so they should not require any
+@_model
+class PickleConverter(ConverterBase):
+    def convert(self, data: 'list[bytes | str]', gadget: 'PickleGadget'):
+        return [self.func(part) if isinstance(part, bytes) else part for part in data]
+
+
+#documents a pickle gadget
+#the gadget func returns the raw bytes (pickle opcodes) that the gadget is responsible for, with the bytes of its required gadgets and params spliced in as is
+#the bytes of a gadget should push exactly one object (the one the gadget is named after) onto the stack, so that they can be spliced into other gadgets
+@_model
+class PickleGadget(GadgetBase):
+    #bytes of the gadget itself, split at where the required gadgets and params are spliced in (as their names in str)
+    #could be converted via apply_converters
+    data: 'list[bytes | str]' = _field(init=False, repr=False)
+
+    #NOTE there is no way to refer to an object from outside of the pickle, so provided gadgets are left empty for the user to fill in
+    def _make_dummy(self):
+        super()._make_dummy()
+        self.data = []
+
+    def __post_init__(self):
+        super().__post_init__()
+        if not self.dummy:
+            #run the gadget with markers in place of the required gadgets and params to find out where they are spliced in
+            spec = _inspect.getfullargspec(self.func)
+            raw = self.func(*[self._marker(arg) for arg in spec.args], **{arg: self._marker(arg) for arg in spec.kwonlyargs})
+            #split with a group alternates between bytes and names, drop the empty bytes in between
+            parts = _re.split(rb'\x00\{(\w+)\}\x00', raw)
+            self.data = [part.decode() if i % 2 else part for i, part in enumerate(parts) if i % 2 or part]
+
+            self._transform_data()
+
+    @staticmethod
+    def _marker(name: str) -> bytes:
+        return b'\x00{' + name.encode() + b'}\x00'
+
+    #params are either raw bytes that push the param, or python objects that are pickled into such bytes
+    @staticmethod
+    def _param_bytes(param) -> bytes:
+        if isinstance(param, (bytes, bytearray)):
+            return bytes(param)
+        #protocol 0 for only printable opcodes, optimize to get rid of the memo, without the STOP opcode
+        return _pickletools.optimize(_pickle.dumps(param, protocol=0))[:-1]
+
+    #writes the bytes of the chain with write, with params (name -> bytes) for this gadget
+    #written part by part (e.g. into a growable buffer, or a stream) to avoid copying the whole chain on every splice like concatenating bytes would
+    def _render_into(self, write, params: 'dict[str, bytes]'):
+        if self.dummy:
+            return
+
+        #dependencies are added in the order of the required gadgets
+        dependencies = dict(zip(_inspect.getfullargspec(self.func).kwonlyargs, self.dependencies))
+        for part in self.data:
+            if isinstance(part, bytes):
+                write(part)
+            elif part in params:
+                write(params[part])
+            else:
+                dependencies[part]._render_into(write, {})
+
+    def _params(self, args) -> 'dict[str, bytes]':
+        params = _inspect.getfullargspec(self.func).args if not self.dummy else []
+        return {name: self._param_bytes(arg) for name, arg in zip(params, args)}
+
+    #terminator call (i.e. the user facing part), runs the whole chain to get the pickle payload
+    def __call__(self, *args) -> bytes:
+        buf = bytearray()
+        self._render_into(buf.extend, self._params(args))
+        buf += _pickle.STOP
+        return bytes(buf)
+
+    #same as __call__, but the bytes are written into fp as they come
+    def render_to(self, fp, *args):
+        write = _stream_writer(fp, True)
+        self._render_into(write, self._params(args))
+        write(_pickle.STOP)
+
+    #override: extract data for pickle gadgets
+    def extract(self):
+        return list(self.data)
+
+    #override: replace data with the converted data
+    def apply_converters(self, converters: 'list[ConverterBase]', data: 'list[bytes | str]' = None):
+        self.data = super().apply_converters(converters, data)
+        return self.data
+
+
+
 #mappings for traverser (key should be a valid folder in gadgets submodule)
 gadget_type_mapping = {
     "python": PythonGadget,
+    "pickle": PickleGadget,
 }
 
 converter_type_mapping = {
     "python": PythonConverter,
+    "pickle": PickleConverter,
 }
\ No newline at end of file
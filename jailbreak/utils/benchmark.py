@@ -0,0 +1,161 @@
+"""
+This utility benchmarks the traverser against synthetic gadget catalogs of increasing size (see synthetic.py),
+measuring the search time and the peak memory allocated during the search.
+
+Results are returned as a list of rows, and can be plotted if matplotlib is installed (it is not a requirement of the repo).
+
+The cleaner (see cleaner.py) is benchmarked separately against synthetic payloads of increasing size, up to megabytes, each with one deep expression too (`--cleaner`).
+"""
+
+import itertools, time, tracemalloc
+
+
+#runs one search for name with the given restrictions, returning (seconds, peak bytes, whether a chain was found)
+def _measure(name: str, restrictions: dict):
+    import jailbreak
+
+    jailbreak.config(**restrictions)
+    #otherwise repeats pick up the previous search of the same gadget (see _SearchState.resume) instead of searching
+    jailbreak._solves.clear()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        gadget = getattr(jailbreak, name)
+    finally:
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak, gadget is not None
+
+
+#generates a catalog for each size and searches for its root gadget, repeat times each
+#catalog kwargs are passed to synthetic.generate_catalog; restrictions are passed to jailbreak.config and are also used for generating violations
+def bench_catalog_sizes(sizes=(50, 100, 200, 400, 800), repeat: int = 3, restrictions: dict = {}, **catalog_kwargs) -> 'list[dict]':
+    from .synthetic import synthetic_catalog
+
+    rows = []
+    for size in sizes:
+        with synthetic_catalog(size=size, restrictions=restrictions, **catalog_kwargs) as root:
+            runs = [_measure(root, restrictions) for _ in range(repeat)]
+        rows.append({
+            'size': size,
+            'seconds': min(r[0] for r in runs),  #min is the least noisy for timing
+            'peak_kb': max(r[1] for r in runs) / 1024,
+            'found': runs[0][2],
+        })
+    return rows
+
+
+#synthetic payload of about size bytes, shaped like a big inline payload (long runs of assigns, e.g. from strless) with a few nested functions in between
+#deep_terms adds one deep expression at the end too (a strless style chr() + chr() + ... concatenation of that many terms), which flat statements never get to
+def _synthetic_payload(size: int, deep_terms: int = 0) -> str:
+    lines, length = ['value_0 = None\n'], 0
+    for i in itertools.count(1):
+        if length >= size:
+            break
+        if i % 50 == 0:
+            block = f'def helper_{i}(arg_{i}, *, dep_{i}):\n    local_{i} = dep_{i}(arg_{i})\n    return [x_{i} for x_{i} in local_{i} if x_{i}]\n'
+        else:
+            block = f'value_{i} = chr_gadget({i % 128}) + value_{i - 1} if value_{i - 1} else str_gadget(value_{i // 2})\n'
+        lines.append(block)
+        length += len(block)
+    if deep_terms:
+        lines.append('value_deep = ' + ' + '.join(f'chr_gadget({i % 128})' for i in range(deep_terms)) + '\n')
+    return ''.join(lines)
+
+
+#cleans a synthetic payload of each size (given the ast, so parsing is not counted), repeat times each
+#every payload ends with a deep expression of deep_terms terms (kept under what ast.parse and ast.unparse themselves can take), see _synthetic_payload
+#tracemalloc slows down allocation heavy code like this a lot, so the peak memory is measured in a separate run from the timed ones
+def bench_cleaner(sizes=(1 << 14, 1 << 16, 1 << 18, 1 << 20, 1 << 22), repeat: int = 3, deep_terms: int = 2000) -> 'list[dict]':
+    import ast
+    from .cleaner import cleaner
+
+    rows = []
+    for size in sizes:
+        code = _synthetic_payload(size, deep_terms)
+        times = []
+        for _ in range(repeat):
+            tree = ast.parse(code)
+            start = time.perf_counter()
+            cleaned = cleaner(tree)
+            times.append(time.perf_counter() - start)
+
+        tree = ast.parse(code)
+        tracemalloc.start()
+        try:
+            cleaner(tree)
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        rows.append({
+            'bytes': len(code),
+            'statements': len(tree.body),
+            'deep_terms': deep_terms,
+            'seconds': min(times),
+            'peak_kb': peak / 1024,
+            'cleaned_bytes': len(cleaned),
+        })
+    return rows
+
+def report_cleaner(rows: 'list[dict]'):
+    print(f'{"bytes":>10} {"statements":>10} {"deep":>6} {"seconds":>10} {"peak_kb":>12} {"cleaned":>10}')
+    for row in rows:
+        print(f'{row["bytes"]:>10} {row["statements"]:>10} {row["deep_terms"]:>6} {row["seconds"]:>10.4f} {row["peak_kb"]:>12.1f} {row["cleaned_bytes"]:>10}')
+
+
+#prints the rows as a table, and plots them to path if given
+def report(rows: 'list[dict]', path: str = None):
+    print(f'{"size":>8} {"seconds":>10} {"peak_kb":>12} {"found":>6}')
+    for row in rows:
+        print(f'{row["size"]:>8} {row["seconds"]:>10.4f} {row["peak_kb"]:>12.1f} {str(row["found"]):>6}')
+
+    if not path:
+        return
+
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print('matplotlib is not installed, skipping plot')
+        return
+
+    sizes = [row['size'] for row in rows]
+    fig, (time_ax, mem_ax) = plt.subplots(1, 2, figsize=(10, 4))
+    time_ax.plot(sizes, [row['seconds'] for row in rows], marker='o')
+    time_ax.set_xlabel('catalog size (base names)')
+    time_ax.set_ylabel('search time (s)')
+    mem_ax.plot(sizes, [row['peak_kb'] for row in rows], marker='o')
+    mem_ax.set_xlabel('catalog size (base names)')
+    mem_ax.set_ylabel('peak memory (KiB)')
+    fig.tight_layout()
+    fig.savefig(path)
+    print(f'plot saved to {path}')
+
+
+if __name__ == '__main__':
+    import argparse, ast
+
+    parser = argparse.ArgumentParser(description='Benchmark the traverser against synthetic gadget catalogs.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 100, 200, 400, 800])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--variants', type=int, default=3)
+    parser.add_argument('--fan-out', type=int, default=2)
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--cycle-density', type=float, default=0.1)
+    parser.add_argument('--violation-rate', type=float, default=0.1)
+    parser.add_argument('--char', default='', help='banned characters')
+    parser.add_argument('--substr', nargs='*', default=[], help='banned substrings')
+    parser.add_argument('--ast', nargs='*', default=[], help='banned ast node names (e.g. Call)')
+    parser.add_argument('--plot', help='path to save the plot to')
+    parser.add_argument('--cleaner', action='store_true', help='benchmark the cleaner against payloads of --sizes bytes instead')
+    args = parser.parse_args()
+
+    if args.cleaner:
+        report_cleaner(bench_cleaner(args.sizes if args.sizes != parser.get_default('sizes') else (1 << 14, 1 << 16, 1 << 18, 1 << 20, 1 << 22), args.repeat))
+        raise SystemExit
+
+    restrictions = {k: v for k, v in {'char': args.char, 'substr': args.substr, 'ast': [getattr(ast, n) for n in args.ast]}.items() if v}
+    rows = bench_catalog_sizes(args.sizes, args.repeat, restrictions, variants=args.variants, fan_out=args.fan_out, depth=args.depth, cycle_density=args.cycle_density, violation_rate=args.violation_rate)
+    report(rows, args.plot)
@@ -3,77 +3,167 @@ This utility provides a cleaner function, which performs the following:
  - rewrites descriptive names into generated names using the character list given
  - (more to come, e.g. ast.unparse unnecessary artifacts removal etc)
 
+The code can be given as source, or as an ast (e.g. `gadget.get_full_ast()`, without unparsing and parsing it again) - the ast is copied first, so the given one is left as is.
+Copying and renaming are single iterative passes over the tree (no recursion limits on big payloads, e.g. inline payloads with thousands of statements or deep expressions),
+with the names handed out from a stream of generated names that is computed once per character list and shared by every call.
+Generated names skip keywords and the names in in_scope, so they never clash with either.
+
 NOTE: unless specified in the in_scope param of the cleaner function already, all name references will be rewritten, including builtin names
       since there is no way for this tool to automatically know what is in the scope or not given just the source
+XXX imported names without an alias are kept as is, so a generated name can still clash with a module imported after it was handed out
 """
 
+import ast, itertools, keyword, sys
+
+
+#name_chars -> names generated so far (in order, shortest first, without keywords), extended as needed
+_name_streams: 'dict[str, list[str]]' = {}
+_name_generators: dict = {}
+
+def _generate_names(name_chars: str):
+    for n in itertools.count(1):
+        for group in itertools.product(name_chars, repeat=n):
+            name = ''.join(group)
+            if not keyword.iskeyword(name):
+                yield name
+
+#the i-th generated name for name_chars
+def _nth_name(name_chars: str, i: int) -> str:
+    names = _name_streams.setdefault(name_chars, [])
+    if i >= len(names):
+        generator = _name_generators.setdefault(name_chars, _generate_names(name_chars))
+        #in chunks, so the stream is not extended one name at a time
+        names.extend(itertools.islice(generator, max(i + 1 - len(names), len(names), 64)))
+    return names[i]
+
+
+#copy of an ast, iteratively like the renaming below so deep expressions (e.g. thousands of chr() + chr() + ...) do not hit the recursion limit
+def _copy_tree(node: ast.AST) -> ast.AST:
+    copy = [None]
+    #(container to put the copy into, key in it, node or list to copy)
+    stack = [(copy, 0, node)]
+    while stack:
+        container, key, value = stack.pop()
+        if isinstance(value, list):
+            new = [None] * len(value)
+            stack.extend((new, i, v) for i, v in enumerate(value))
+        elif isinstance(value, ast.AST):
+            new = type(value)()
+            for attr, v in vars(value).items():
+                #set right away either way, so the attributes stay in the same order
+                setattr(new, attr, v)
+                if isinstance(v, (list, ast.AST)):
+                    stack.append((new, attr, v))
+        else:
+            new = value
+        if isinstance(container, list):
+            container[key] = new
+        else:
+            setattr(container, key, new)
+    return copy[0]
+
+
+#marks the end of a function scope on the stack, see cleaner
+_END_SCOPE = object()
 
 # use __import__ to avoid tainting namespace
-def cleaner(code, name_chars=__import__('string').ascii_lowercase, in_scope=[]):
-    import ast, itertools
-
-    tree = ast.parse(code)
-
-    def name_generator():
-        n = 1
-        while True:
-            yield from (''.join(group) for group in itertools.product(name_chars, repeat=n))
-            n += 1
-    
-    def generate_name(gen = name_generator()):
-        return next(gen)
-
-    def apply(node: ast.AST, scope: dict):
-        #convert names to names generated with chars in name_chars
-        def convert_name(node: ast.AST, field: str):
-            name = getattr(node, field)
-            if name not in scope:
-                scope[name] = generate_name()
-            setattr(node, field, scope[name])
-        
+def cleaner(code: 'str | ast.AST', name_chars=__import__('string').ascii_lowercase, in_scope=[]) -> str:
+    #trees can share nodes with others (e.g. hash-consed chains), so rename a copy of our own
+    tree = ast.parse(code) if isinstance(code, str) else _copy_tree(code)
+
+    reserved = set(in_scope)
+    scope = {n: n for n in in_scope}
+    #names added to (or replaced in) the scope in each function being visited, with what they were before, so they can be undone when leaving it
+    #instead of copying the whole scope for every function
+    undo: 'list[list[tuple[str, str | None]]]' = []
+    counter = 0
+
+    def generate_name() -> str:
+        nonlocal counter
+        name = _nth_name(name_chars, counter)
+        counter += 1
+        while name in reserved:
+            name = _nth_name(name_chars, counter)
+            counter += 1
+        return name
+
+    def bind(name: str, new: str):
+        if undo:
+            undo[-1].append((name, scope.get(name)))
+        scope[name] = new
+
+    #convert names to names generated with chars in name_chars
+    def convert_name(node: ast.AST, field: str):
+        name = getattr(node, field)
+        if name not in scope:
+            bind(name, generate_name())
+        setattr(node, field, scope[name])
+
+    #pre order, children in field order - same order the names would be handed out in recursively
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node is _END_SCOPE:
+            #back to the parent scope, names first seen in the function are not in there
+            for name, old in reversed(undo.pop()):
+                if old is None:
+                    del scope[name]
+                else:
+                    scope[name] = old
+            continue
+
         if isinstance(node, ast.Name):
             convert_name(node, 'id')
         elif isinstance(node, ast.arg):
             convert_name(node, 'arg')
         elif isinstance(node, ast.ExceptHandler):
-            convert_name(node, 'name')
-            
-        #make a copy of the parent scope so edits on this scope wont affect the parent scope 
+            if node.name is not None:
+                convert_name(node, 'name')
         elif isinstance(node, ast.FunctionDef):
             #convert name first so its in the parent scope before narrowing scope
             convert_name(node, 'name')
-            scope = dict(scope)
-
+            undo.append([])
+            stack.append(_END_SCOPE)
         #do not rewrite imported names
         elif isinstance(node, ast.alias):
             #if we aliased the import, rewrite that name
             if node.asname:
                 convert_name(node, 'asname')
-            #otherwise keep the names in the mapping, we cannot rename it
+            #otherwise keep the names in the mapping, we cannot rename it (`import a.b` binds a)
             else:
-                scope[node.name] = node.name
-        
-        return node, scope
-
-    #altered from NodeTransformer to track scoping
-    #XXX now that i think about it there doesnt seem to be any reason to track scope
-    #    since even if the names collide the runtime would handle it for all the valid cases
-    #    and the invalid cases doesnt work in the original code anyways
-    #    so a global renamer with no care about scoping would work just as well
-    def visit(curr: ast.AST, scope: dict):
-        curr, scope = apply(curr, scope)
-
-        for field in curr._fields:
-            try:
-                attr = getattr(curr, field)
-                if isinstance(attr, list):
-                    for i, node in enumerate(attr):
-                        if isinstance(node, ast.AST):
-                            attr[i] = visit(node, scope)
-                elif isinstance(attr, ast.AST):
-                    setattr(curr, field, visit(attr, scope))
-            except AttributeError:
-                pass
-        return curr
-        
-    return ast.unparse(visit(tree, {n: n for n in in_scope}))
\ No newline at end of file
+                name = node.name.split('.')[0]
+                reserved.add(name)
+                bind(name, name)
+
+        #children go on the stack in reverse, so they come off it in order
+        children = []
+        for field in node._fields:
+            attr = getattr(node, field, None)
+            if isinstance(attr, list):
+                children.extend(child for child in attr if isinstance(child, ast.AST))
+            elif isinstance(attr, ast.AST):
+                children.append(attr)
+        stack.extend(reversed(children))
+
+    return _unparse(tree)
+
+
+#ast.unparse recurses for every level of nesting (a few frames each), so deeply nested expressions (e.g. long concatenations) need more room than the default limit
+def _unparse(tree: ast.AST) -> str:
+    try:
+        return ast.unparse(tree)
+    except RecursionError:
+        pass
+
+    depth, stack = 0, [(tree, 1)]
+    while stack:
+        node, level = stack.pop()
+        depth = max(depth, level)
+        stack.extend((child, level + 1) for child in ast.iter_child_nodes(node))
+
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(limit + depth * 4)
+    try:
+        return ast.unparse(tree)
+    finally:
+        sys.setrecursionlimit(limit)
@@ -0,0 +1,245 @@
+"""
+This utility provides a static dependency graph over a gadget catalog (of one gadget type), built from the required gadgets (kwonly args) of each gadget.
+
+The traverser uses it to prune the search before descending into anything:
+ - gadget names that can never be resolved (no gadget for the name, or only reachable through cycles) are rejected immediately
+ - gadget variants with a required gadget that can never be resolved under the configured `provided`/`banned` are skipped
+ - gadget variants can be ordered so that cheaper (lower chain height) and acyclic variants are tried first
+
+Resolvability is the least fixpoint of "a name is resolvable if it is provided, or any of its (non banned) variants have all required gadgets resolvable",
+which is exactly the set of names with a finite chain - cycles only count if something in the cycle has another way out.
+Converters are not considered since they only add more required gadgets, so the analysis never prunes a variant that could succeed.
+
+The graph is updated incrementally as gadgets are registered, along with any resolvability already computed for a profile.
+"""
+
+import bisect
+
+
+#all variants whose name starts with the given name, see get_all_gadgets_in_repo XXX note
+def _prefix_range(sorted_names: 'list[str]', name: str) -> 'list[str]':
+    start = bisect.bisect_left(sorted_names, name)
+    end = start
+    while end < len(sorted_names) and sorted_names[end].startswith(name):
+        end += 1
+    return sorted_names[start:end]
+
+
+#least fixpoint of resolvable names and their minimum chain heights under a (provided, banned) profile
+class _Resolution:
+    def __init__(self, graph: 'DependencyGraph', provided: frozenset, banned: frozenset) -> None:
+        self.graph = graph
+        self.provided = provided
+        self.banned = banned
+        #name -> minimum height of a chain for the name (0 for provided), only has resolvable names
+        self.heights: 'dict[str, int]' = {name: 0 for name in provided}
+        #variant -> height of its chain if all of its required gadgets are resolvable
+        self.viable: 'dict[str, int]' = {}
+        #(runtime costs, their version) -> variant -> estimated runtime of its cheapest chain, see chain_costs
+        self._chain_costs: 'dict[tuple, dict[str, float]]' = {}
+
+        self._relax(list(graph.requires))
+
+    #monotone worklist: heights only ever decrease (or become resolvable), so this converges, and is reusable for incremental updates
+    def _relax(self, queue: 'list[str]'):
+        graph = self.graph
+        while queue:
+            variant = queue.pop()
+            if variant in self.banned or variant not in graph.requires:
+                continue
+
+            deps = graph.requires[variant]
+            if not all(dep in self.heights for dep in deps):
+                continue
+            height = 1 + max((self.heights[dep] for dep in deps), default=0)
+            if variant in self.viable and self.viable[variant] <= height:
+                continue
+            self.viable[variant] = height
+
+            #every name the variant is a candidate for gets a (possibly) better height
+            for name in graph.names_matching(variant):
+                if name in self.provided or self.heights.get(name, height + 1) <= height:
+                    continue
+                self.heights[name] = height
+                queue.extend(graph.required_by.get(name, ()))
+
+    #a name that was not known when the variants were relaxed, so its height has to be picked up from them directly
+    def add_name(self, name: str, variants: 'list[str]'):
+        heights = [self.viable[v] for v in variants if v in self.viable]
+        if heights and name not in self.provided:
+            self.heights[name] = min(heights)
+
+    def resolvable(self, name: str) -> bool:
+        return name in self.heights
+
+    #estimated runtime of the cheapest chain of every viable variant, given the runtime cost of every variant on its own (see utils/runtime.py)
+    #same worklist as _relax, with the costs of the required gadgets summed up instead of the heights maxed
+    def chain_costs(self, costs) -> 'dict[str, float]':
+        key = (costs, costs.version)
+        if key in self._chain_costs:
+            return self._chain_costs[key]
+
+        graph = self.graph
+        names: 'dict[str, float]' = {name: 0.0 for name in self.provided}
+        variants: 'dict[str, float]' = {}
+        queue = list(self.viable)
+        while queue:
+            variant = queue.pop()
+            deps = graph.requires[variant]
+            if not all(dep in names for dep in deps):
+                continue
+            cost = costs.cost(variant) + sum(names[dep] for dep in deps)
+            if variant in variants and variants[variant] <= cost:
+                continue
+            variants[variant] = cost
+
+            for name in graph.names_matching(variant):
+                if name in self.provided or (name in names and names[name] <= cost):
+                    continue
+                names[name] = cost
+                queue.extend(graph.required_by.get(name, ()))
+
+        self._chain_costs = {key: variants}
+        return variants
+
+
+class DependencyGraph:
+    def __init__(self, gadgets: 'dict[str, object]' = {}) -> None:
+        #variant -> required gadget names, in kwonly args order
+        self.requires: 'dict[str, tuple[str]]' = {}
+        #name -> variants requiring that name
+        self.required_by: 'dict[str, set[str]]' = {}
+        #position of the variant in the catalog, to list variants in the same order as the catalog dict
+        self.position: 'dict[str, int]' = {}
+        self._sorted: 'list[str]' = []
+        self._counter = 0
+
+        self._variants_cache: 'dict[str, list[str]]' = {}
+        self._resolutions: 'dict[tuple, _Resolution]' = {}
+        self._sccs: 'dict[str, int] | None' = None
+
+        for name, func in gadgets.items():
+            self.add(name, func)
+
+    def add(self, variant: str, func):
+        import inspect
+
+        #a variant that is added again (e.g. reloaded) keeps its place in the catalog order, same as the catalog dict
+        position = self.position.get(variant, self._counter)
+        if variant in self.requires:
+            self.remove(variant)
+
+        deps = tuple(inspect.getfullargspec(func).kwonlyargs)
+        new_names = [dep for dep in deps if dep not in self.required_by and dep not in self._variants_cache]
+        self.requires[variant] = deps
+        for dep in deps:
+            self.required_by.setdefault(dep, set()).add(variant)
+        self.position[variant] = position
+        self._counter = max(self._counter, position + 1)
+        bisect.insort(self._sorted, variant)
+
+        for name, variants in self._variants_cache.items():
+            if variant.startswith(name):
+                bisect.insort(variants, variant, key=self.position.__getitem__)
+        self._sccs = None
+
+        for resolution in self._resolutions.values():
+            for name in new_names:
+                resolution.add_name(name, _prefix_range(self._sorted, name))
+            resolution._relax([variant])
+            resolution._chain_costs = {}
+
+    def remove(self, variant: str):
+        for dep in self.requires.pop(variant, ()):
+            self.required_by[dep].discard(variant)
+        del self.position[variant]
+        self._sorted.remove(variant)
+
+        for variants in self._variants_cache.values():
+            if variant in variants:
+                variants.remove(variant)
+        self._sccs = None
+        #removals can make things unresolvable, which the worklist cannot undo - recompute on the next lookup
+        self._resolutions = {}
+
+    #names (required gadget names or requested names) that variant is a candidate for
+    def names_matching(self, variant: str) -> 'list[str]':
+        return [variant[:i] for i in range(1, len(variant) + 1) if variant[:i] in self.required_by or variant[:i] in self._variants_cache]
+
+    #all variants for name in catalog order
+    def variants(self, name: str) -> 'list[str]':
+        if name not in self._variants_cache:
+            self._variants_cache[name] = sorted(_prefix_range(self._sorted, name), key=self.position.__getitem__)
+            for resolution in self._resolutions.values():
+                resolution.add_name(name, self._variants_cache[name])
+        return self._variants_cache[name]
+
+    def resolution(self, provided, banned) -> _Resolution:
+        key = (frozenset(provided), frozenset(banned))
+        if key not in self._resolutions:
+            self._resolutions[key] = _Resolution(self, *key)
+        return self._resolutions[key]
+
+    #strongly connected components of the name graph (name -> required gadget names of all its variants), as name -> component id
+    #iterative tarjan to avoid recursion limits on big catalogs
+    def sccs(self) -> 'dict[str, int]':
+        if self._sccs is not None:
+            return self._sccs
+
+        edges = lambda name: {dep for variant in self.variants(name) for dep in self.requires[variant]}
+        index, lowlink, on_stack, stack, components = {}, {}, set(), [], {}
+        counter = component = 0
+        for root in list(self.required_by) + [v.split('__')[0] for v in self.requires]:
+            if root in index:
+                continue
+            work = [(root, iter(edges(root)))]
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, children = work[-1]
+                child = next(children, None)
+                if child is not None:
+                    if child not in index:
+                        index[child] = lowlink[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(edges(child))))
+                    elif child in on_stack:
+                        lowlink[node] = min(lowlink[node], index[child])
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        components[member] = component
+                        if member == node:
+                            break
+                    component += 1
+
+        self._sccs = components
+        return components
+
+    #whether variant (a candidate for name) requires something in the same cycle as name
+    def is_cyclic(self, name: str, variant: str) -> bool:
+        sccs = self.sccs()
+        #names without a component (e.g. not in the catalog at all) are in no cycle
+        return any(dep == name or (dep in sccs and sccs[dep] == sccs.get(name)) for dep in self.requires[variant])
+
+    #variants of name that could resolve under the profile, cheapest acyclic ones first if by_cost is set (otherwise catalog order)
+    #cheapest is the lowest chain height, or the lowest estimated runtime of the chain if runtime costs are given (see utils/runtime.py)
+    def candidates(self, name: str, provided, banned, by_cost: bool = False, costs=None) -> 'list[str]':
+        resolution = self.resolution(provided, banned)
+        variants = [v for v in self.variants(name) if v in resolution.viable]
+        if by_cost:
+            cost = resolution.chain_costs(costs) if costs is not None else resolution.viable
+            #sort is stable, so ties stay in catalog order
+            variants.sort(key=lambda v: (self.is_cyclic(name, v), cost[v]))
+        return variants
@@ -0,0 +1,29 @@
+"""
+This utility finds the gadget variants that are dominated by a sibling (another variant of the same gadget name) under a restriction profile,
+so the searcher can skip them instead of trying them one after another (see `config(dominance=...)`).
+
+Variant b dominates variant a under a profile if a can never get a chain where b could not:
+ - b has no violations under the profile (a can have any), so b never needs converters that could fail on it where they work on a
+ - b requires a subset of the gadget names a requires (same names in another order counts), so every required gadget b fails on, a fails on too
+ - with max_len, b is no longer than a on its own, so a chain that does not fit with b would not fit with a either
+The searcher skips a dominated variant once one of its dominators was passed over in the same candidate list without getting a chain
+(not counting dominators skipped for being banned or in the current path, see _try_gadget) - so the chain found is always the same as without the pruning,
+the search just does not descend into the required gadgets of variants that are bound to fail.
+
+XXX sizes are of the unconverted variants, a converter could in theory make a dominated variant shorter than its dominator
+"""
+
+
+#variant -> variants dominating it, for the variants (of one gadget name)
+#clean is the variants without violations under the profile, requires is variant -> required gadget names, size is variant -> own size (or None if it does not matter)
+def dominators(variants: 'list[str]', clean: 'set[str]', requires: 'dict[str, tuple[str]]', size=None) -> 'dict[str, list[str]]':
+    result = {}
+    for a in variants:
+        deps = set(requires[a])
+        for b in variants:
+            if b == a or b not in clean or not set(requires[b]) <= deps:
+                continue
+            if size is not None and size(b) > size(a):
+                continue
+            result.setdefault(a, []).append(b)
+    return result
@@ -0,0 +1,118 @@
+"""
+This utility provides a catalog wide feasibility matrix, for ruling out gadget variants from their own source alone before the traverser descends into anything.
+
+The static features of a gadget variant (ast node types, characters, substrings, docstring platforms/versions - whatever the gadget type's `_extract_features` function parses)
+are computed once, the first time the variant (or another variant of its gadget name) comes up in a search - parsing the whole catalog up front would take
+longer than most searches do, and a search usually only ever looks at a small part of it.
+Every (restriction type, restricted value) pair that gets looked up becomes a column: a bitset over the rows computed so far of the variants that violate it.
+A set of restrictions then splits the computed rows into three groups with a handful of bitwise ops over the columns, instead of a check per variant:
+ - clean: no violations at all
+ - fixable: has violations, but every violation has a registered converter (which might or might not get rid of them)
+ - hopeless: has a violation that no registered converter applies to
+The traverser only tries clean and fixable variants, and takes their violations from the cached features instead of parsing them again.
+Variants without a row yet are in none of the groups, so rows have to be computed (see ensure) before the variants are looked up in them.
+
+Columns and groups are cached, so sweeping many restriction profiles over the same catalog only ever computes each column once.
+The matrix is updated incrementally as rows are computed and gadgets are registered.
+
+NOTE: bitsets are plain python ints (bit i is the variant with index i), which are arbitrary size and have fast bitwise ops
+"""
+
+import collections
+
+
+Groups = collections.namedtuple('Groups', ['clean', 'fixable', 'hopeless'])
+
+
+class FeasibilityMatrix:
+    #extract: (variant name, func) -> {field: checks}, matchers: field -> matcher(restrictions, checks) (see _restrictions_mapping)
+    def __init__(self, extract, matchers: dict, gadgets: 'dict[str, object]' = {}) -> None:
+        self.extract = extract
+        self.matchers = matchers
+
+        self.index: 'dict[str, int]' = {}
+        self.names: 'list[str | None]' = []  #index -> variant, None if removed
+        self.funcs: 'dict[str, object]' = {}
+        self.features: 'dict[str, dict]' = {}  #only for the variants with a row computed
+        self.live = 0  #bitset of variants currently in the catalog
+        self.computed = 0  #bitset of variants with a row computed
+
+        #(field, value) -> bitset of variants violating it
+        self._columns: 'dict[tuple, int]' = {}
+        self._groups: 'dict[tuple, Groups]' = {}
+
+        for name, func in gadgets.items():
+            self.add(name, func)
+
+    def add(self, variant: str, func):
+        if variant in self.index:
+            self.remove(variant)
+
+        self.index[variant] = len(self.names)
+        self.names.append(variant)
+        self.funcs[variant] = func
+        self.live |= 1 << self.index[variant]
+        #the row is computed once it is needed, see ensure
+
+    def remove(self, variant: str):
+        i = self.index.pop(variant)
+        self.names[i] = None
+        del self.funcs[variant]
+        self.features.pop(variant, None)
+        self.live &= ~(1 << i)
+        self.computed &= ~(1 << i)
+        #columns can keep the stale bit, everything is masked with live
+        self._groups = {}
+
+    #computes the rows of the variants that do not have one yet
+    def ensure(self, variants: 'list[str]'):
+        for variant in variants:
+            if variant in self.index and variant not in self.features:
+                bit = 1 << self.index[variant]
+                self.features[variant] = features = self.extract(variant, self.funcs[variant])
+                self.computed |= bit
+
+                for (field, value), column in self._columns.items():
+                    if self.matchers[field]([value], features[field]):
+                        self._columns[field, value] = column | bit
+                self._groups = {}
+
+    #features of variant, computing its row if needed
+    def row(self, variant: str) -> dict:
+        self.ensure([variant])
+        return self.features[variant]
+
+    def column(self, field: str, value) -> int:
+        if (field, value) not in self._columns:
+            matcher, column = self.matchers[field], 0
+            for variant, features in self.features.items():
+                if matcher([value], features[field]):
+                    column |= 1 << self.index[variant]
+            self._columns[field, value] = column
+        return self._columns[field, value]
+
+    #splits the catalog into groups for the restrictions (same format as set_config['restrictions']), given the applicable converters
+    def groups(self, restrictions: dict, converters: dict) -> Groups:
+        #unsupported fields are left for _count_violations to complain about
+        restricted = {(field, value) for field, values in restrictions.items() if field in self.matchers for value in values}
+        #converters can be registered at any time, so which restrictions they cover is a part of the key
+        fixable = frozenset(r for r in restricted if converters.get(r[0], {}).get(r[1]))
+        key = (frozenset(restricted), fixable)
+
+        if key not in self._groups:
+            violating = hopeless = 0
+            for r in restricted:
+                column = self.column(*r)
+                violating |= column
+                if r not in fixable:
+                    hopeless |= column
+            rows = self.live & self.computed
+            self._groups[key] = Groups(rows & ~violating, rows & violating & ~hopeless, rows & hopeless)
+        return self._groups[key]
+
+    def is_in(self, variant: str, group: int) -> bool:
+        return bool(group >> self.index[variant] & 1)
+
+    def variants_in(self, group: int) -> 'list[str]':
+        return [self.names[i] for i in range(group.bit_length()) if group >> i & 1]
+
@@ -0,0 +1,105 @@
+"""
+This utility provides an inverted index over a gadget catalog (of one gadget type), for answering capability queries like
+"which gadgets give `sys` without `_` on 3.12 for linux?" without searching for chains, or grepping the gadget files by hand.
+
+Every posting list is a bitset over the catalog (same bit per variant as the feasibility matrix, see feasibility.py), covering:
+ - gadget names (all variants for the name, with the same prefix matching as the searcher) and the names of required gadgets
+ - the static features of the variants, i.e. the columns of the feasibility matrix - ast node types, characters, substrings and docstring platforms/versions
+ - the size of each variant on its own (as sorted prefix bitsets, so a length cap is a bisect)
+Postings for the names and for the ast nodes and characters that show up in the catalog are built up front, so a query is a handful of bitwise ops.
+The index follows the catalog as gadgets are (un)registered, like the dependency graph and feasibility matrix it is built on.
+
+Use it via `jailbreak.find(...)`, which takes the restrictions the same way as `jailbreak.config`.
+"""
+
+import bisect
+
+
+class CatalogIndex:
+    #size: variant name -> size of the variant on its own, only computed once a query caps the size
+    def __init__(self, matrix, graph, size) -> None:
+        self.matrix = matrix
+        self.graph = graph
+        self.size = size
+
+        #name -> bitset of its variants, required gadget name -> bitset of the variants requiring it
+        self._names: 'dict[str, int]' = {}
+        self._requires: 'dict[str, int]' = {}
+        #(sorted sizes, prefix bitsets) - the i-th prefix bitset has the variants with the i + 1 smallest sizes
+        self._sizes: 'tuple[list[int], list[int]] | None' = None
+        self._build()
+
+    def _build(self):
+        matrix = self.matrix
+        #queries are over the whole catalog, so every row is needed
+        matrix.ensure(list(matrix.index))
+        for variant in matrix.index:
+            self.name_bits(variant.split('__')[0])
+        for dep in list(self.graph.required_by):
+            self.requires_bits(dep)
+        #feature values that can be enumerated from the catalog itself (substrs can be anything, those are looked up lazily)
+        for field in ['ast', 'char', 'opcode', 'global']:
+            if field in matrix.matchers:
+                for value in {v for features in matrix.features.values() for v in features[field]}:
+                    matrix.column(field, value)
+
+    #the catalog changed, postings are rebuilt (the feasibility matrix updates its columns on its own)
+    def add(self, variant: str, func):
+        self._names, self._requires, self._sizes = {}, {}, None
+        self._build()
+
+    def remove(self, variant: str):
+        self._names, self._requires, self._sizes = {}, {}, None
+
+    def _bits(self, variants) -> int:
+        bits = 0
+        for variant in variants:
+            if variant in self.matrix.index:
+                bits |= 1 << self.matrix.index[variant]
+        return bits
+
+    def name_bits(self, name: str) -> int:
+        if name not in self._names:
+            self._names[name] = self._bits(self.graph.variants(name))
+        return self._names[name]
+
+    def requires_bits(self, name: str) -> int:
+        if name not in self._requires:
+            self._requires[name] = self._bits(self.graph.required_by.get(name, ()))
+        return self._requires[name]
+
+    #variants with a size of at most max_len
+    def size_bits(self, max_len: int) -> int:
+        if self._sizes is None:
+            sized = sorted((self.size(variant), i) for variant, i in self.matrix.index.items())
+            prefixes, bits = [], 0
+            for _, i in sized:
+                bits |= 1 << i
+                prefixes.append(bits)
+            self._sizes = ([s for s, _ in sized], prefixes)
+        sizes, prefixes = self._sizes
+        count = bisect.bisect_right(sizes, max_len)
+        return prefixes[count - 1] if count else 0
+
+    #variants (in catalog order) for name (any if None) that require every gadget in requires, have no violations of the restrictions (same as config),
+    #use every value in uses (field -> values, e.g. {'ast': [ast.Lambda]}), and are at most max_len long on their own
+    def find(self, name: str = None, requires: 'list[str]' = (), uses: dict = {}, max_len: int = None, **restrictions) -> 'list[str]':
+        matrix = self.matrix
+        for field in list(restrictions) + list(uses):
+            if field not in matrix.matchers:
+                raise ValueError(f'{field} is not a supported restriction for this gadget type (supported: {", ".join(matrix.matchers)})')
+
+        bits = matrix.live
+        if name is not None:
+            bits &= self.name_bits(name)
+        for dep in requires:
+            bits &= self.requires_bits(dep)
+        for field, values in restrictions.items():
+            for value in values:
+                bits &= ~matrix.column(field, value)
+        for field, values in uses.items():
+            for value in values:
+                bits &= matrix.column(field, value)
+        if max_len is not None and bits:
+            bits &= self.size_bits(max_len)
+        return matrix.variants_in(bits)
@@ -0,0 +1,219 @@
+"""
+This utility infers the restriction profile of a jail from a local oracle, instead of filling in `jailbreak.config(char=..., substr=..., ast=...)` by hand.
+
+The oracle is any callable that takes a code string and returns whether the jail accepts it (e.g. a wrapper around the filter function of the target).
+Probes are built so that the only thing that can get them rejected is the things being tested:
+ - chars and substrs are put into a carrier that is valid python regardless of its content - a comment (`#...`), or a string (`\"\"\"...\"\"\"`) if `#` is banned
+ - ast nodes are tested with a minimal snippet for each node type (see _ast_probes), only once the chars of the snippet are known to be allowed
+ - the maximum length is found with an exponential then binary search over the length of a carrier padded with an allowed letter or digit
+
+Things are tested with adaptive group testing: a whole group is probed at once, and only the groups that get rejected are split in half and probed again,
+so a handful of banned things out of a hundred takes a couple dozen probes instead of a hundred. Every probe result is cached, so nothing is probed twice.
+
+`infer_restrictions` (also available as `jailbreak.infer_restrictions`) returns the restrictions ready to use as `jailbreak.config(**result.restrictions)`,
+along with how many probes it took (and how many testing one thing at a time would have), and what could not be tested.
+
+NOTE this assumes the jail is a blacklist that is monotone - adding banned things to an accepted probe can only get it rejected, and a rejected probe stays rejected with more things in it
+XXX ast nodes can only be told apart if the other nodes of their snippet are allowed - the snippets only use names besides their own node where possible,
+    but e.g. a banned ast.Expr (every expression statement) makes most of them untestable
+"""
+
+import ast, dataclasses, string
+
+
+#substrings commonly banned by jails, tested by default
+common_substrs = [
+    '__', 'import', 'os', 'sys', 'eval', 'exec', 'open', 'read', 'system', 'popen', 'subprocess', 'builtins', 'globals', 'locals', 'vars',
+    'class', 'base', 'mro', 'subclasses', 'getattr', 'setattr', 'lambda', 'compile', 'input', 'breakpoint', 'help', 'flag', 'chr', 'ord', 'dict',
+]
+
+#snippet for each ast node type, with as few other node types as possible (just names, no constants or calls) so a banned node does not make the others untestable
+_ast_probes = {
+    ast.Call: 'a()',
+    ast.Attribute: 'a.b',
+    ast.Subscript: 'a[b]',
+    ast.Constant: '0',
+    ast.Name: 'a',
+    ast.BinOp: 'a+b',
+    ast.UnaryOp: '-a',
+    ast.BoolOp: 'a or b',
+    ast.Compare: 'a<b',
+    ast.IfExp: 'a if b else c',
+    ast.Lambda: 'lambda:a',
+    ast.NamedExpr: '(a:=b)',
+    ast.List: '[a]',
+    ast.Tuple: 'a,b',
+    ast.Set: '{a}',
+    ast.Dict: '{a:b}',
+    ast.ListComp: '[a for a in b]',
+    ast.SetComp: '{a for a in b}',
+    ast.DictComp: '{a:a for a in b}',
+    ast.GeneratorExp: '(a for a in b)',
+    ast.JoinedStr: "f'{a}'",
+    ast.Assign: 'a=b',
+    ast.AugAssign: 'a+=b',
+    ast.Import: 'import a',
+    ast.ImportFrom: 'from a import b',
+    ast.If: 'if a:a',
+    ast.For: 'for a in b:a',
+    ast.While: 'while a:a',
+    ast.With: 'with a:a',
+    ast.Try: 'try:a\nexcept:a',
+    ast.FunctionDef: 'def a():a',
+    ast.ClassDef: 'class a:a',
+}
+
+#printable chars except the line breaks python treats as whitespace inside a line
+default_chars = ''.join(c for c in string.printable if c not in '\r\x0b\x0c')
+
+#carriers for chars and substrs, the empty carrier must be accepted for it to be used
+_carriers = [
+    lambda s: '#' + s,
+    lambda s: '"""' + s + '"""',
+]
+
+
+@dataclasses.dataclass
+class InferredRestrictions:
+    #ready to use as jailbreak.config(**restrictions)
+    restrictions: dict
+    #oracle calls made, and how many it would have taken to test every char, substr and ast node on its own
+    probes: int = 0
+    naive_probes: int = 0
+    #probes per field (char, substr, ast, max_len)
+    field_probes: dict = dataclasses.field(default_factory=dict)
+    #things that could not be tested (e.g. no valid probe for it, or it contains banned chars), per field
+    untested: dict = dataclasses.field(default_factory=dict)
+
+
+class _Prober:
+    def __init__(self, oracle, max_probe_len: int) -> None:
+        self.oracle = oracle
+        self.max_probe_len = max_probe_len
+        self.cache: 'dict[str, bool]' = {}
+        self.probes = 0
+        self.carrier = None
+
+    def accepts(self, code: str) -> bool:
+        if code not in self.cache:
+            self.probes += 1
+            self.cache[code] = bool(self.oracle(code))
+        return self.cache[code]
+
+    #probe for a group of chars or substrs in the carrier, or None if there is no valid one
+    def carried(self, items: list) -> 'str | None':
+        #chars that would end the carrier early go first, line breaks last so a comment does not end early
+        items = sorted(items, key=lambda s: (0 if s[-1:] in '"\\' else 2 if s[:1] == '\n' else 1))
+        code = self.carrier(''.join(items))
+        return code if len(code) <= self.max_probe_len and _valid(code) else None
+
+    #adaptive group testing: probes the whole group, and splits rejected ones in half until the banned items are found
+    #probe builds the code for a group of items (None if it cannot be built), returns (banned, untested)
+    def group_test(self, items: list, probe) -> 'tuple[list, list]':
+        banned, untested = [], []
+        todo = [list(items)] if items else []
+        while todo:
+            group = todo.pop()
+            code = probe(group)
+            if code is not None and self.accepts(code):
+                continue
+            if len(group) == 1:
+                (banned if code is not None else untested).append(group[0])
+                continue
+            #keep the order the items were given in
+            todo += [group[len(group) // 2:], group[:len(group) // 2]]
+        return banned, untested
+
+
+def _valid(code: str) -> bool:
+    try:
+        compile(code, '<probe>', 'exec')
+        return True
+    except (SyntaxError, ValueError):
+        return False
+
+
+#ast node types in a snippet, other than the ones every snippet has anyway (module, contexts)
+def _snippet_nodes(snippet: str) -> 'set[type]':
+    return {type(n) for n in ast.walk(ast.parse(snippet)) if not isinstance(n, (ast.Module, ast.expr_context))}
+
+
+#infers the restrictions of the jail behind oracle (code string -> accepted or not)
+#chars, substrs and snippets (ast node type -> code using it) are what to test for, max_len is whether to look for a length limit (up to max_probe_len)
+def infer_restrictions(oracle, chars: str = default_chars, substrs: 'list[str]' = common_substrs, snippets: dict = None, max_len: bool = True, max_probe_len: int = 1 << 16) -> InferredRestrictions:
+    prober = _Prober(oracle, max_probe_len)
+    snippets = {**_ast_probes, **(snippets or {})}
+    chars = list(dict.fromkeys(chars))
+    result = InferredRestrictions({}, naive_probes=len(chars) + len(substrs) + len(snippets))
+
+    def count(field: str, since: int):
+        result.field_probes[field] = prober.probes - since
+
+    prober.carrier = next((carrier for carrier in _carriers if prober.accepts(carrier(''))), None)
+    if prober.carrier is None:
+        #nothing to carry the chars and substrs in, so they cannot be told apart from the carrier itself
+        result.untested = {'char': ''.join(chars), 'substr': list(substrs), 'ast': list(snippets)}
+        result.probes = prober.probes
+        return result
+
+    since = prober.probes
+    banned_chars, untested_chars = prober.group_test(chars, prober.carried)
+    count('char', since)
+    if banned_chars:
+        result.restrictions['char'] = ''.join(banned_chars)
+
+    if max_len:
+        #padded with an allowed letter or digit, which is valid in either carrier
+        since = prober.probes
+        pad = next((c for c in string.ascii_letters + string.digits if c in chars and c not in banned_chars and c not in untested_chars), None)
+        if pad is not None:
+            empty = len(prober.carrier(''))
+            fits = lambda n: prober.accepts(prober.carrier(pad * (n - empty)))
+            low, high = empty, None
+            n = max(empty * 2, 16)
+            while n <= max_probe_len:
+                if not fits(n):
+                    high = n
+                    break
+                low, n = n, n * 2
+            if high is not None:
+                while high - low > 1:
+                    mid = (low + high) // 2
+                    low, high = (mid, high) if fits(mid) else (low, mid)
+                result.restrictions['max_len'] = low
+                #keeps the groups of the rest under it, so they are not rejected for their length alone
+                prober.max_probe_len = low
+        count('max_len', since)
+
+    since = prober.probes
+    #substrs with banned chars are banned anyway
+    testable = [s for s in substrs if not set(s).intersection(banned_chars)]
+    banned_substrs, untested_substrs = prober.group_test(testable, prober.carried)
+    count('substr', since)
+    if banned_substrs:
+        result.restrictions['substr'] = banned_substrs
+
+    since = prober.probes
+    #snippets are joined line by line, or with ; if line breaks are banned (which only works for single line snippets)
+    separator = '\n' if '\n' not in banned_chars else ';'
+    allowed = lambda snippet: not set(snippet).intersection(banned_chars) and not any(s in snippet for s in banned_substrs)
+    testable = [node for node, snippet in snippets.items() if allowed(snippet) and (separator == '\n' or '\n' not in snippet)]
+    def probe(nodes: list) -> 'str | None':
+        if len(nodes) > 1 and separator in banned_chars:
+            return None
+        code = separator.join(snippets[node] for node in nodes)
+        #compound statements cannot follow a ;
+        return code if len(code) <= prober.max_probe_len and _valid(code) else None
+    rejected, untested_nodes = prober.group_test(testable, probe)
+    #a rejected snippet only says its own node is banned if all the other nodes in it showed up in an accepted probe
+    #(only the nodes there are snippets for, the rest like ast.arguments only ever show up along with them)
+    seen = {node for code, ok in prober.cache.items() if ok and _valid(code) for node in _snippet_nodes(code)}
+    banned_nodes = [node for node in rejected if _snippet_nodes(snippets[node]) & snippets.keys() - {node} <= seen]
+    untested_nodes += [node for node in rejected if node not in banned_nodes]
+    count('ast', since)
+    if banned_nodes:
+        result.restrictions['ast'] = banned_nodes
+
+    result.untested = {field: untested for field, untested in [('char', ''.join(untested_chars)), ('substr', untested_substrs), ('ast', untested_nodes + [node for node in snippets if node not in testable])] if untested}
+    result.probes = prober.probes
+    return result
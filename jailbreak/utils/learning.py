@@ -0,0 +1,89 @@
+"""
+This utility keeps statistics of how gadget variants fared in past searches, for trying the variants that are likely to work (and cheap to work out) first
+instead of in the order they happen to be defined in (`dir` of the gadget module, i.e. alphabetical).
+
+Every variant the searcher tries is recorded against the features of the restriction profile it was tried under (every banned char, substr and ast node type,
+every version and platform, plus `*` for any profile at all), as successes, failures and the amount of gadget variants it took to find out (see _try_gadget).
+Only failures that did not depend on the path are recorded, the same ones the searcher remembers in `_SearchState.failed`.
+
+A variant is then predicted to work with the success rate (with one success and one failure as the prior) of the profile feature it did worst with,
+and ordered by the expected amount of variants tried before a chain is found - the average tries it took, divided by the predicted success rate.
+Variants with no statistics are predicted the same, so a fresh store keeps the order the searcher would have used anyway (the sort is stable).
+
+Use it via `jailbreak.config(learning=VariantStats(path))`, which records into it and orders the candidates by it (and saves it to path after every search).
+Learning is off by default (`learning=False`), so searches are deterministic unless asked otherwise.
+The statistics in a store can be listed with `python -m jailbreak.utils.learning <path>`.
+
+XXX features are counted independently, so a failure under a profile is also put down to the features that had nothing to do with it
+    (e.g. a variant that fails for a banned ast node also gets a failure for every banned char in the same profile) until it succeeds with them
+"""
+
+import json, os
+
+
+#profile features of the restrictions (same format as set_config['restrictions']), as the keys the statistics are stored under
+def profile_features(restrictions: dict) -> 'list[str]':
+    features = ['*']
+    for field, values in restrictions.items():
+        for value in values:
+            features.append(f'{field}:{value.__name__ if isinstance(value, type) else repr(value)}')
+    return features
+
+
+class VariantStats:
+    #path persists the statistics as json across runs
+    def __init__(self, path: str = None) -> None:
+        self.path = path
+        #variant -> profile feature -> [successes, failures, variants tried in total]
+        self.stats: 'dict[str, dict[str, list[int]]]' = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.stats = json.load(f)
+        self._dirty = False
+
+    def record(self, variant: str, features: 'list[str]', success: bool, cost: int):
+        variant_stats = self.stats.setdefault(variant, {})
+        for feature in features:
+            counts = variant_stats.setdefault(feature, [0, 0, 0])
+            counts[0 if success else 1] += 1
+            counts[2] += cost
+        self._dirty = True
+
+    #predicted chance of the variant having a chain under a profile with features
+    def success_rate(self, variant: str, features: 'list[str]') -> float:
+        variant_stats = self.stats.get(variant, {})
+        return min((s + 1) / (s + f + 2) for s, f, _ in [variant_stats.get(feature, [0, 0, 0]) for feature in features])
+
+    #expected amount of variants tried before the variant (and the ones it requires) gives a chain, lower is better
+    def expected_cost(self, variant: str, features: 'list[str]') -> float:
+        s, f, cost = self.stats.get(variant, {}).get('*', [0, 0, 0])
+        return (cost + 1) / (s + f + 1) / self.success_rate(variant, features)
+
+    #variants ordered by expected_cost, ties keep the given order
+    def order(self, variants: 'list[str]', features: 'list[str]') -> 'list[str]':
+        return sorted(variants, key=lambda variant: self.expected_cost(variant, features))
+
+    def save(self, path: str = None):
+        with open(path or self.path, 'w') as f:
+            json.dump(self.stats, f)
+        self._dirty = False
+
+    #saves to path if anything was recorded since the last save
+    def flush(self):
+        if self.path and self._dirty:
+            self.save()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='List the statistics of past searches in a variant statistics store.')
+    parser.add_argument('path', help='json file the statistics are stored in')
+    parser.add_argument('--feature', default='*', help='profile feature to list the statistics for, e.g. "char:\'_\'" or "ast:Call" (default: any profile)')
+    args = parser.parse_args()
+
+    stats = VariantStats(args.path)
+    rows = [(variant, *variant_stats[args.feature]) for variant, variant_stats in stats.stats.items() if args.feature in variant_stats]
+    print(f'{"variant":<40} {"success":>8} {"failure":>8} {"avg tried":>10}')
+    for variant, s, f, cost in sorted(rows, key=lambda row: stats.expected_cost(row[0], [args.feature])):
+        print(f'{variant:<40} {s:>8} {f:>8} {cost / (s + f):>10.1f}')
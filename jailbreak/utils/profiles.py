@@ -0,0 +1,183 @@
+"""
+This utility precomputes which gadgets can be built under a set of commonly seen jail profiles, so the searcher can answer them with a lookup instead of a search.
+
+A profile is a set of `jailbreak.config` kwargs (restrictions, provided, banned, inline, gadget_type, ...).
+`build_table` sweeps profiles x gadget names in a pool of worker processes, and records for every pair:
+ - whether the gadget can be built at all
+ - the spec of the best chain found (the gadget, converter and dependency names, see `chain_spec`)
+ - the length of its payload (with the param names of the gadget as the params)
+
+Every profile is searched with each variant order (see `config(order=...)`) and the shortest payload is kept -
+NOTE this is the shortest of the chains the searcher finds, not necessarily the shortest chain possible
+
+The table is saved as JSON along with a format version and a fingerprint of the catalog (gadget and converter sources) it was built from,
+and only answers lookups while the running catalog still has the same fingerprint.
+Use it via `jailbreak.config(table=ProfileTable.load(path), ...)` - searches with a profile and gadget name in the table return right away, everything else is searched as usual.
+
+Can also be run as a script (`python -m jailbreak.utils.profiles --help`), with the profiles declared in a python file as a `profiles` list of config kwargs dicts.
+"""
+
+import ast, hashlib, inspect, json, multiprocessing, time
+
+
+#bumped whenever the table format changes, tables of other versions are not loaded
+TABLE_VERSION = 2
+
+#set_config keys that are not part of the profile - either they do not change which chain is found,
+#or (order, costs) the table already keeps the best chain of every order (but the shortest, so order='runtime' never uses the table)
+_non_profile_keys = {'tracer', 'deadline_ms', 'max_expansions', 'table', 'order', 'costs', 'dominance', 'learning'}
+
+#common jail profiles, used when no profiles are given
+common_profiles = [
+    {},
+    {'char': '\'"'},
+    {'char': '_'},
+    {'char': '\'"', 'inline': True},
+    {'ast': [ast.Call]},
+    {'ast': [ast.Attribute]},
+    {'ast': [ast.Lambda, ast.GeneratorExp]},
+    {'platforms': ['linux'], 'versions': [12]},
+]
+
+common_names = ['get_shell', 'os', 'sys', 'builtins_dict', 'import_builtin_module', 'get_obj_dict']
+
+
+#json friendly, order independent form of a config value (ast node types become their names, lists of values are sorted)
+def _canonical(value):
+    if isinstance(value, type) and issubclass(value, ast.AST):
+        return 'ast.' + value.__name__
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sorted((_canonical(v) for v in value), key=repr)
+    if isinstance(value, (bytes, bytearray)):
+        return 'bytes:' + bytes(value).hex()
+    return value
+
+#the profile of a set_config as a string, for keying the table
+def profile_key(set_config: dict) -> str:
+    profile = {k: v for k, v in set_config.items() if k not in _non_profile_keys}
+    #strings and bytes restrictions (e.g. char='\'"') are sets of characters
+    profile['restrictions'] = {field: sorted(set(v)) if isinstance(v, (str, bytes)) else v for field, v in set_config['restrictions'].items()}
+    return json.dumps(_canonical(profile), sort_keys=True)
+
+
+#fingerprint of everything a chain depends on - the sources of every gadget and converter
+def catalog_fingerprint() -> str:
+    from ..models import all_gadgets, registered_converters
+
+    digest = hashlib.sha256(str(TABLE_VERSION).encode())
+    funcs = [(gadget_type, name, func) for gadget_type, gadgets in all_gadgets.items() for name, func in gadgets.items()]
+    funcs += [('converter', func.__name__, func) for func in registered_converters]
+    for kind, name, func in sorted(funcs, key=lambda f: (f[0], f[1])):
+        try:
+            source = inspect.getsource(func)
+        except (OSError, TypeError):
+            source = func.__code__.co_code.hex()
+        digest.update(f'{kind}\0{name}\0{source}\0'.encode())
+    return digest.hexdigest()
+
+
+#nested spec of a chain: [gadget name, dummy, [converter specs], [dependency specs]], converter specs are [converter name, [dependency specs]]
+def chain_spec(gadget) -> list:
+    return [gadget.name, gadget.dummy, [[c.name, [chain_spec(d) for d in c.dependencies]] for c in gadget.converters], [chain_spec(d) for d in gadget.dependencies]]
+
+#builds the chain back from its spec, the same way the models are specified manually (see example.py)
+def chain_from_spec(spec: list, gadget_class, converter_class):
+    name, dummy, converters, dependencies = spec
+    if dummy:
+        return gadget_class(name=name, dummy=True)
+    return gadget_class(
+        name=name,
+        converters=[converter_class(name=c, dependencies=[chain_from_spec(d, gadget_class, converter_class) for d in deps]) for c, deps in converters],
+        dependencies=[chain_from_spec(d, gadget_class, converter_class) for d in dependencies],
+    )
+
+
+class ProfileTable:
+    def __init__(self, entries: dict = None, fingerprint: str = None) -> None:
+        #profile key -> gadget name -> {'feasible', 'spec', 'length'}
+        self.entries: 'dict[str, dict[str, dict]]' = entries or {}
+        self.fingerprint = fingerprint or catalog_fingerprint()
+        #(catalog version, whether the fingerprint matches), so the fingerprint is only recomputed when the catalog changes
+        self._valid = None
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump({'version': TABLE_VERSION, 'fingerprint': self.fingerprint, 'entries': self.entries}, f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path: str) -> 'ProfileTable':
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != TABLE_VERSION:
+            raise ValueError(f'profile table version {data.get("version")} is not supported (expected {TABLE_VERSION})')
+        return cls(data['entries'], data['fingerprint'])
+
+    def valid(self) -> bool:
+        from .. import models
+
+        if self._valid is None or self._valid[0] != models.catalog_version:
+            self._valid = (models.catalog_version, catalog_fingerprint() == self.fingerprint)
+        return self._valid[1]
+
+    #the entry of name under the set_config, or None if the table does not know
+    def lookup(self, name: str, set_config: dict) -> 'dict | None':
+        if not self.valid():
+            return None
+        return self.entries.get(profile_key(set_config), {}).get(name)
+
+
+#searches name under profile with every variant order, keeping the shortest payload
+#runs in the worker processes, so it only returns json friendly data
+def _solve(args: 'tuple[dict, str]') -> 'tuple[str, str, dict]':
+    import jailbreak
+    from ..models import set_config
+
+    profile, name = args
+    best = {'feasible': False, 'spec': None, 'length': None}
+    for order in ['catalog', 'graph']:
+        #no budgets, the table should only say a gadget is not feasible if the search is exhausted
+        jailbreak.config(**{**profile, 'order': order, 'deadline_ms': None, 'max_expansions': None})
+        key = profile_key(set_config)
+        gadget = getattr(jailbreak, name)
+        if gadget is None or not jailbreak.last_search.complete:
+            continue
+        payload = gadget(*inspect.getfullargspec(gadget.func).args)
+        if best['length'] is None or len(payload) < best['length']:
+            best = {'feasible': True, 'spec': chain_spec(gadget), 'length': len(payload)}
+    return key, name, best
+
+
+#sweeps profiles x names in a process pool
+def build_table(profiles: 'list[dict]' = common_profiles, names: 'list[str]' = common_names, processes: int = None) -> ProfileTable:
+    table = ProfileTable()
+    jobs = [(profile, name) for profile in profiles for name in names]
+    with multiprocessing.Pool(processes) as pool:
+        for key, name, entry in pool.imap_unordered(_solve, jobs):
+            table.entries.setdefault(key, {})[name] = entry
+    return table
+
+
+if __name__ == '__main__':
+    import argparse, importlib.util
+
+    parser = argparse.ArgumentParser(description='Precompute a lookup table of which gadgets can be built under a set of jail profiles.')
+    parser.add_argument('path', help='file to write the table to')
+    parser.add_argument('--profiles', help='python file declaring a `profiles` list of jailbreak.config kwargs dicts (default: common_profiles)')
+    parser.add_argument('--names', nargs='*', default=common_names, help='gadget names to search for')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    profiles = common_profiles
+    if args.profiles:
+        spec = importlib.util.spec_from_file_location('_jailbreak_profiles', args.profiles)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        profiles = module.profiles
+
+    start = time.perf_counter()
+    table = build_table(profiles, args.names, args.processes)
+    table.save(args.path)
+    feasible = sum(entry['feasible'] for entries in table.entries.values() for entry in entries.values())
+    print(f'{len(profiles)} profiles x {len(args.names)} names ({feasible} feasible) in {time.perf_counter() - start:.2f}s, written to {args.path}')
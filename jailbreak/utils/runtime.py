@@ -0,0 +1,180 @@
+"""
+This utility measures how long every gadget takes to run, for jails that put a CPU time limit on the payload itself
+(e.g. `list_classes` filtered by `str(c)` over every loaded class, or `Exception__with_type` building a class and raising, cost a lot more than `builtins_dict['Exception']`).
+
+Every gadget variant is microbenchmarked in a fresh subprocess of its own (`python -m jailbreak.utils.runtime --harness`), which:
+ - defines the gadget from its source alone, the same way it ends up in a payload
+ - binds its required gadgets to the reference objects of the verifier (see `_provided_builtins` in utils/verifier.py), so only the cost of the gadget itself is measured
+ - calls it with the sample params in _sample_params if it takes any, then times it with the best of a few repeats
+Results are cached by a hash of the gadget source (and the python version), so only new or changed gadgets are ever run again, and can be persisted as JSON.
+
+The costs are used via `jailbreak.config(order='runtime', costs=RuntimeCosts(...))`, which tries the gadget variants with the cheapest estimated chain first
+(the cost of the variant plus the cheapest chains of its required gadgets, see `DependencyGraph.chain_costs`), and reports the estimated cost of the chain found in `jailbreak.last_search.runtime_cost`.
+Gadgets that were not measured yet are measured the first time a cost is needed, so `RuntimeCosts()` can be used as is (at the cost of measuring the whole catalog on the first search).
+Gadgets that could not be measured (e.g. they take params with no sample, or their required gadgets have no reference object) are assumed to cost the median of the ones that could.
+
+NOTE gadgets are run for real in the subprocesses - gadgets with side effects (e.g. get_shell) are only run if they have sample params
+XXX the costs are of the gadgets as written, converted gadgets (e.g. strless) can cost more than that
+"""
+
+import hashlib, inspect, json, os, statistics, subprocess, sys, textwrap
+
+
+#params to call gadgets with, as python expressions (gadget name -> params), gadgets that take params and are not here are not measured
+_sample_params = {
+    'import_builtin_module': "'_imp'",
+    'dict_getitem': "{'key': 1}, 'key'",
+    'getattr': "str, 'join'",
+    'chr': '65',
+    'hex': '65',
+    'iter': '[1, 2, 3]',
+    'get_obj_dict': 'str',
+}
+
+
+#runs in the subprocess, job is (source, variant name, params expression), prints the seconds per call (or null if it could not be run)
+def _harness(job: 'tuple[str, str, str | None]', min_time: float = 0.02, repeat: int = 3):
+    import timeit
+    from .verifier import _provided_builtins
+
+    source, variant, params = job
+    #the payload could print, keep stdout for the result
+    out = os.fdopen(os.dup(1), 'w')
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1):
+        os.dup2(devnull, fd)
+
+    try:
+        namespace = {}
+        exec(compile(source, f'<{variant}>', 'exec'), namespace)
+        func = namespace[variant]
+        deps = _provided_builtins(inspect.getfullargspec(func).kwonlyargs)
+        args = eval(f'({params},)') if params else ()
+        call = lambda: func(*args, **deps)
+        #also makes sure it runs at all before timing it
+        call()
+
+        timer = timeit.Timer(call)
+        number = 1
+        while timer.timeit(number) < min_time:
+            number *= 10
+        result = min(timer.repeat(repeat, number)) / number
+    except BaseException:
+        result = None
+
+    out.write(json.dumps(result))
+    out.flush()
+
+
+class RuntimeCosts:
+    #cache_path persists the measured costs as json across runs, timeout is per gadget (a gadget that times out costs that much)
+    def __init__(self, cache_path: str = None, timeout: float = 10.0, gadget_type: str = 'python') -> None:
+        self.cache_path = cache_path
+        self.timeout = timeout
+        self.gadget_type = gadget_type
+        #source hash -> seconds per call, None if it could not be measured
+        self.cache: 'dict[str, float | None]' = {}
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self.cache = json.load(f)
+
+        #bumped on every new measurement, for telling whether anything derived from the costs is stale
+        self.version = 0
+        #(catalog version, variant -> source hash)
+        self._hashes = None
+        #(version, median cost of the measured variants)
+        self._median = None
+
+    #source, params and source hash of every variant in the catalog
+    def _jobs(self) -> 'dict[str, tuple[tuple, str]]':
+        from .. import models
+
+        if self._hashes is None or self._hashes[0] != models.catalog_version:
+            jobs = {}
+            for variant, func in models.all_gadgets[self.gadget_type].items():
+                try:
+                    source = textwrap.dedent(inspect.getsource(func))
+                except (OSError, TypeError):
+                    continue  #no source to run, e.g. defined in the repl
+                job = (source, variant, _sample_params.get(variant.split('__')[0]))
+                jobs[variant] = (job, hashlib.sha256(json.dumps([sys.version_info[:2], job]).encode()).hexdigest())
+            self._hashes = (models.catalog_version, jobs)
+        return self._hashes[1]
+
+    def _run(self, job: tuple) -> 'float | None':
+        #the package might not be importable from the cwd, e.g. when running from a checkout
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([root] + [p for p in [os.environ.get('PYTHONPATH')] if p]))
+        try:
+            proc = subprocess.run([sys.executable, '-m', __name__, '--harness'], input=json.dumps(job), capture_output=True, text=True, timeout=self.timeout, env=env)
+            return json.loads(proc.stdout) if proc.returncode == 0 else None
+        except subprocess.TimeoutExpired:
+            return self.timeout
+        except ValueError:
+            return None
+
+    #measures every variant in names (default: the whole catalog) that is not cached yet, returns variant -> seconds per call
+    def measure(self, names: 'list[str]' = None) -> 'dict[str, float | None]':
+        jobs = self._jobs()
+        names = list(jobs) if names is None else [name for name in names if name in jobs]
+        pending = [name for name in names if jobs[name][1] not in self.cache]
+        for name in pending:
+            job, key = jobs[name]
+            self.cache[key] = self._run(job)
+
+        if pending:
+            self.version += 1
+            if self.cache_path:
+                self.save(self.cache_path)
+        return {name: self.cache[jobs[name][1]] for name in names}
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.cache, f)
+
+    #seconds per call of the variant, or the median of the measured variants if it could not be measured
+    #measures the catalog first if the variant was not measured yet
+    def cost(self, variant: str) -> float:
+        jobs = self._jobs()
+        if variant in jobs and jobs[variant][1] not in self.cache:
+            self.measure()
+        cost = self.cache.get(jobs[variant][1]) if variant in jobs else None
+        if cost is None:
+            if self._median is None or self._median[0] != self.version:
+                measured = [c for c in self.cache.values() if c is not None]
+                if not measured:
+                    #every variant would cost the same, which is no order at all
+                    raise ValueError('no gadget could be measured, runtime costs are unavailable')
+                self._median = (self.version, statistics.median(measured))
+            cost = self._median[1]
+        return cost
+
+    #estimated seconds to run a chain (a gadget from the generator) - every gadget in a chain is only run once, however many gadgets require it
+    def chain_cost(self, gadget) -> float:
+        seen, todo = set(), [gadget]
+        while todo:
+            gadget = todo.pop()
+            if not gadget.dummy:
+                seen.add(gadget.name)
+            todo += gadget.dependencies + [d for c in gadget.converters for d in c.dependencies]
+        return sum(self.cost(name) for name in seen)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Measure the runtime cost of every gadget, each in a subprocess of its own.')
+    parser.add_argument('path', nargs='?', help='json file to cache the costs in')
+    parser.add_argument('--names', nargs='*', help='gadget variants to measure (default: all of them)')
+    parser.add_argument('--gadget-type', default='python')
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--harness', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.harness:
+        _harness(json.load(sys.stdin))
+        sys.exit(0)
+
+    costs = RuntimeCosts(args.path, args.timeout, args.gadget_type)
+    for name, cost in sorted(costs.measure(args.names).items(), key=lambda item: (item[1] is None, item[1] or 0)):
+        print(f'{cost * 1e6:>12.2f}us {name}' if cost is not None else f'{"-":>14} {name}')
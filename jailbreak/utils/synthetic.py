@@ -0,0 +1,170 @@
+"""
+This utility generates synthetic gadget catalogs for testing how the traverser scales, since the repo catalog is too small to show it.
+
+The generated files follow the same format as the files in the gadgets/python directory (see the gadgets README),
+and the catalog shape can be tuned with the following knobs:
+ - size: amount of gadget base names (i.e. gadget files) to generate
+ - variants: amount of gadget variants in each file
+ - fan_out: amount of gadgets each variant requires
+ - depth: amount of dependency layers; base names in the last layer have no requirements and terminate the chains
+ - cycle_density: chance of a requirement pointing back to the same or a shallower layer instead of the next one, creating cycles
+ - violation_rate: chance of a variant containing code that violates the given restrictions
+
+The catalogs can then be loaded via `register_user_gadget` through `load_catalog`, or used as a temporary gadgets directory via `synthetic_catalog`.
+The root gadget of a catalog (the one to request from the traverser) is always `<prefix>_<0 padded to the width of size>`.
+
+NOTE: the names are zero padded so that no base name is a prefix of another - the traverser matches gadgets by prefix (see get_all_gadgets_in_repo)
+"""
+
+import ast, contextlib, importlib.util, inspect, os, random, sys, tempfile
+
+
+#code that trips each kind of restriction, as statements inside the gadget body
+#XXX only covers the common ast nodes, other nodes fall back to a string constant (which at least trips ast.Constant restrictions)
+_ast_snippets = {
+    ast.Call: 'x = id(x)',
+    ast.Attribute: 'x = x.__class__',
+    ast.Subscript: 'x = [x][0]',
+    ast.ListComp: 'x = [i for i in [x]][0]',
+    ast.GeneratorExp: 'x = next((i for i in [x]))',
+    ast.Lambda: 'x = (lambda: x)()',
+    ast.Constant: 'x = (x, 0)[0]',
+    ast.BinOp: 'x = (x, 1 + 1)[0]',
+    ast.Compare: 'x = (x, 1 < 2)[0]',
+    ast.List: 'x = [x][-1]',
+    ast.Tuple: 'x = (x,)[0]',
+    ast.Dict: 'x = {0: x}[0]',
+    ast.JoinedStr: "x = (x, f'{x}')[0]",
+    ast.Try: 'try:\n    pass\nexcept:\n    pass',
+    ast.For: 'for i in [x]:\n    pass',
+}
+
+def _violating_snippet(restrictions: dict, rng: random.Random) -> str:
+    choices = []
+    for c in restrictions.get('char', ''):
+        #repr to get a valid literal, note quotes will also trip any quote restrictions along with c
+        choices.append(f'x = (x, {c!r})[0]')
+    for s in restrictions.get('substr', []):
+        choices.append(f'x = (x, {s!r})[0]')
+    for node in restrictions.get('ast', []):
+        choices.append(_ast_snippets.get(node, "x = (x, 'constant')[0]"))
+
+    return rng.choice(choices) if choices else None
+
+
+#generates the catalog into path, returns the list of files written
+def generate_catalog(path: str, size: int = 100, variants: int = 3, fan_out: int = 2, depth: int = 5, cycle_density: float = 0.1, violation_rate: float = 0.1, restrictions: dict = {}, prefix: str = 'syn', seed: int = 0) -> 'list[str]':
+    rng = random.Random(seed)
+    width = len(str(size - 1))
+    names = [f'{prefix}_{i:0{width}d}' for i in range(size)]
+
+    #split the base names into layers, root is always alone at the top
+    depth = max(1, min(depth, size))
+    layers = [[names[0]]] + [names[1:][l::depth - 1] for l in range(depth - 1)] if depth > 1 else [names]
+    layers = [layer for layer in layers if layer]
+
+    os.makedirs(path, exist_ok=True)
+    files = []
+    for l, layer in enumerate(layers):
+        for name in layer:
+            src = f'"""\nSynthetic gadgets for `{name}`.\n"""\n'
+            for v in range(variants):
+                deps = set()
+                #the last layer terminates the chains
+                if l < len(layers) - 1:
+                    for _ in range(fan_out):
+                        if rng.random() < cycle_density:
+                            deps.add(rng.choice(rng.choice(layers[:l + 1])))
+                        else:
+                            deps.add(rng.choice(layers[l + 1]))
+                    deps.discard(name)
+                deps = sorted(deps)
+
+                body = ['x = None']
+                if rng.random() < violation_rate:
+                    snippet = _violating_snippet(restrictions, rng)
+                    if snippet:
+                        body.append(snippet)
+                body.append(f'return [x{"".join(", " + d for d in deps)}]')
+
+                args = f'*, {", ".join(deps)}' if deps else ''
+                src += f'\n\ndef {name}__v{v}({args}):\n' + '\n'.join('    ' + line for stmt in body for line in stmt.splitlines()) + '\n'
+
+            filename = os.path.join(path, name + '.py')
+            with open(filename, 'w') as f:
+                f.write(src)
+            files.append(filename)
+
+    return files
+
+
+#imports all gadget files in path (same discovery rules as get_all_gadgets_in_repo), and registers them as user gadgets
+#returns the list of registered gadget names for unload_catalog
+def load_catalog(path: str, gadget_type: str = 'python') -> 'list[str]':
+    from .. import register_user_gadget
+
+    registered = []
+    for dirpath, _, filenames in os.walk(path):
+        for f in sorted(filenames):
+            filename, ext = os.path.splitext(f)
+            if ext.lower() != '.py':
+                continue
+
+            #import via file location since the directory is not a part of the package
+            #the module must stay in sys.modules for inspect.getsource to find the source of the gadgets later
+            module_name = f'_jailbreak_synthetic_{abs(hash(dirpath))}_{filename}'
+            spec = importlib.util.spec_from_file_location(module_name, os.path.join(dirpath, f))
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+
+            for attrname in dir(module):
+                if attrname.startswith(filename) and inspect.isfunction(getattr(module, attrname)):
+                    register_user_gadget(getattr(module, attrname), gadget_type)
+                    registered.append(attrname)
+
+    return registered
+
+
+#removes the gadgets registered by load_catalog
+def unload_catalog(names: 'list[str]', gadget_type: str = 'python'):
+    from .. import unregister_user_gadget
+
+    for name in names:
+        unregister_user_gadget(name, gadget_type)
+
+
+#generates a catalog into a temporary gadgets directory and registers it for the duration of the with block
+#yields the root gadget name to request
+@contextlib.contextmanager
+def synthetic_catalog(gadget_type: str = 'python', **kwargs):
+    with tempfile.TemporaryDirectory(prefix='jailbreak_synthetic_') as path:
+        generate_catalog(path, **kwargs)
+        names = load_catalog(path, gadget_type)
+        try:
+            yield names[0].split('__')[0]
+        finally:
+            unload_catalog(names, gadget_type)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate a synthetic gadget catalog in the gadgets/python format.')
+    parser.add_argument('path', help='directory to write the gadget files to')
+    parser.add_argument('--size', type=int, default=100)
+    parser.add_argument('--variants', type=int, default=3)
+    parser.add_argument('--fan-out', type=int, default=2)
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--cycle-density', type=float, default=0.1)
+    parser.add_argument('--violation-rate', type=float, default=0.1)
+    parser.add_argument('--char', default='', help='banned characters to generate violations for')
+    parser.add_argument('--substr', nargs='*', default=[], help='banned substrings to generate violations for')
+    parser.add_argument('--ast', nargs='*', default=[], help='banned ast node names (e.g. Call) to generate violations for')
+    parser.add_argument('--prefix', default='syn')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    restrictions = {'char': args.char, 'substr': args.substr, 'ast': [getattr(ast, n) for n in args.ast]}
+    files = generate_catalog(args.path, args.size, args.variants, args.fan_out, args.depth, args.cycle_density, args.violation_rate, restrictions, args.prefix, args.seed)
+    print(f'wrote {len(files)} gadget files to {args.path}')
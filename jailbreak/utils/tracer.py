@@ -0,0 +1,168 @@
+"""
+This utility provides tracers for investigating the gadget traverser, e.g. when a search is slow or fails.
+
+A tracer is enabled via `jailbreak.config(tracer=<tracer instance>)`, and receives the following events from the traverser:
+ - search_start / search_end: a requested gadget search begins / ends (search_end also has whether a chain was found), `multi` is one search for all its names
+ - gadget_tried: a gadget variant is being tried for a required gadget name
+ - search_resumed: the search picks up from the previous search of the gadget, since config() only added restrictions since (see _SearchState.resume)
+ - memo_hit: a gadget variant was already resolved in another branch, and is reused
+ - failure_reused: a gadget variant already failed regardless of the path it was on, and is skipped
+ - gadget_infeasible: a gadget variant has a violation no converter applies to, so it is skipped without being tried (see utils/feasibility.py)
+ - gadget_dominated: a gadget variant is skipped without being tried, since a sibling variant is at least as good under the restrictions (see utils/dominance.py)
+ - violations_found: a gadget variant violates the restrictions
+ - converter_chosen: a converter (with its dependencies resolved) was chosen for a violation
+ - permutation_tried: a converter application order was tried on a gadget (with whether it got rid of the violations)
+ - dependency_failed: a required gadget of a gadget variant could not be resolved, so the variant is dropped
+ - length_pruned: the lower bound of the payload length is already over max_len, so the variant is dropped (see config(max_len=...))
+ - length_exceeded: a complete chain for the requested gadget turned out to be longer than max_len, so the next variant is tried
+
+Every event is a dict with `event`, `ts` (time.perf_counter_ns) and `depth` (length of the dependency path to the gadget) keys, plus the event specific data.
+If track_memory is set, tracemalloc is started for the duration of the search, every event also has `mem` (currently traced bytes),
+and the tracer's `peak` has the peak traced bytes after search_end.
+
+Tracers are only called when set in config, so there is no overhead when tracing is disabled.
+"""
+
+import json, time, tracemalloc
+
+
+class Tracer:
+    def __init__(self, track_memory: bool = False) -> None:
+        self.track_memory = track_memory
+        self.peak = None
+        self._started_tracemalloc = False
+
+    #called by the traverser, builds the event and hands it to handle
+    def emit(self, event: str, depth: int, **data):
+        data['event'] = event
+        data['ts'] = time.perf_counter_ns()
+        data['depth'] = depth
+
+        #started before mem is read, so search_start does not report 0 (or whatever was left of the last search)
+        if event == 'search_start' and self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            else:
+                #someone else is tracing, the peak should still be of this search only
+                tracemalloc.reset_peak()
+
+        if self.track_memory:
+            data['mem'] = tracemalloc.get_traced_memory()[0]
+
+        if event == 'search_end' and self.track_memory:
+            self.peak = data['peak'] = tracemalloc.get_traced_memory()[1]
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+        self.handle(data)
+
+    #sinks override this
+    def handle(self, event: dict):
+        pass
+
+
+#json cannot represent sets and ast node types, flatten them into something readable
+def _jsonable(obj):
+    if isinstance(obj, (set, frozenset, list, tuple)):
+        return sorted((_jsonable(o) for o in obj), key=str)
+    if isinstance(obj, dict):
+        return {str(k): _jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, type):
+        return obj.__name__
+    if isinstance(obj, (str, int, float, bool)) or obj is None:
+        return obj
+    return str(obj)
+
+
+#counts events by type and by gadget, for a quick overview of where the search spends its time
+class SummaryTracer(Tracer):
+    def __init__(self, track_memory: bool = False) -> None:
+        super().__init__(track_memory)
+        self.counts = {}
+        self.gadget_counts = {}
+        self.elapsed_ns = 0
+        self._start = None
+
+    def handle(self, event: dict):
+        kind = event['event']
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+        if 'gadget' in event and kind not in ['search_start', 'search_end']:
+            per_gadget = self.gadget_counts.setdefault(event['gadget'], {})
+            per_gadget[kind] = per_gadget.get(kind, 0) + 1
+
+        if kind == 'search_start':
+            self._start = event['ts']
+        elif kind == 'search_end' and self._start is not None:
+            self.elapsed_ns += event['ts'] - self._start
+            #could be tracked by a parent MultiTracer instead
+            self.peak = event.get('peak', self.peak)
+
+    #returns the summary as a printable table, with the top gadgets by the amount of times they were tried
+    def table(self, top: int = 10) -> str:
+        lines = [f'{"event":<20} {"count":>8}']
+        lines += [f'{kind:<20} {count:>8}' for kind, count in sorted(self.counts.items())]
+        lines.append(f'{"elapsed ms":<20} {self.elapsed_ns / 1e6:>8.2f}')
+        if self.peak is not None:
+            lines.append(f'{"peak KiB":<20} {self.peak / 1024:>8.1f}')
+
+        lines.append('')
+        lines.append(f'{"gadget":<40} {"tried":>6} {"memo":>6} {"viol":>6} {"depfail":>8}')
+        by_tried = sorted(self.gadget_counts.items(), key=lambda item: -item[1].get('gadget_tried', 0))
+        for gadget, counts in by_tried[:top]:
+            lines.append(f'{gadget:<40} {counts.get("gadget_tried", 0):>6} {counts.get("memo_hit", 0):>6} {counts.get("violations_found", 0):>6} {counts.get("dependency_failed", 0):>8}')
+        return '\n'.join(lines)
+
+
+#writes each event as a line of json into fp
+class JsonLinesTracer(Tracer):
+    def __init__(self, fp, track_memory: bool = False) -> None:
+        super().__init__(track_memory)
+        self.fp = fp
+
+    def handle(self, event: dict):
+        self.fp.write(json.dumps(_jsonable(event)) + '\n')
+
+
+#collects events in the chrome trace event format (viewable in chrome://tracing or perfetto), written to fp on every search_end
+#(if fp is seekable the file is rewritten with all searches so far, otherwise each search is dumped after the previous one)
+#each depth is shown as its own thread lane, and tracked memory is shown as a counter
+class ChromeTracer(Tracer):
+    def __init__(self, fp, track_memory: bool = False) -> None:
+        super().__init__(track_memory)
+        self.fp = fp
+        self.events = []
+
+    def handle(self, event: dict):
+        kind, ts, depth = event['event'], event['ts'] / 1000, event['depth']  #chrome uses microseconds
+        args = _jsonable({k: v for k, v in event.items() if k not in ['event', 'ts', 'depth']})
+
+        if kind == 'search_start':
+            self.events.append({'name': event['gadget'], 'ph': 'B', 'ts': ts, 'pid': 0, 'tid': 0, 'args': args})
+        elif kind == 'search_end':
+            self.events.append({'name': event['gadget'], 'ph': 'E', 'ts': ts, 'pid': 0, 'tid': 0, 'args': args})
+        else:
+            self.events.append({'name': kind, 'ph': 'i', 's': 't', 'ts': ts, 'pid': 0, 'tid': depth, 'args': args})
+
+        if 'mem' in event:
+            self.events.append({'name': 'memory', 'ph': 'C', 'ts': ts, 'pid': 0, 'args': {'bytes': event['mem']}})
+
+        if kind == 'search_end':
+            if self.fp.seekable():
+                self.fp.seek(0)
+                self.fp.truncate()
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, self.fp)
+            self.fp.flush()
+
+
+#fans events out to multiple tracers
+class MultiTracer(Tracer):
+    def __init__(self, *tracers: Tracer, track_memory: bool = False) -> None:
+        super().__init__(track_memory)
+        self.tracers = tracers
+
+    def handle(self, event: dict):
+        for tracer in self.tracers:
+            tracer.handle(dict(event))
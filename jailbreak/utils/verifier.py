@@ -0,0 +1,271 @@
+"""
+This utility verifies generated payloads by actually running them in a local reference jail, since the generator never runs the chains it generates
+(e.g. a gadget with the wrong `fork_exec` signature for a version would only fail on the target).
+
+The reference jail is built from a restriction profile (the same kwargs as `jailbreak.config`, defaults to the active config), and performs the following:
+ - rejects the payload if it contains any banned ast nodes, characters or substrings, or is longer than `max_len`
+ - reports the payload as unsupported if the profile has `versions` or `platforms` that the python running the reference jail is not one of (it cannot tell either way)
+ - runs the payload with `exec`, with `__builtins__` containing the builtins plus the names in `provided`
+   (builtins by that name, modules importable by that name, or the reference objects in _reference_gadgets for gadget names like `builtins_dict`)
+
+The builtins are all there by default, since that is what the catalog assumes - restrictions are what the jail filters out of the payload, and gadgets use builtins freely
+(e.g. `builtins_dict__self` uses `chr`, and `builtins_dict__gi_builtins` gets the builtins of the frame running the payload, which the builtins gadgets then look up names in).
+With `full_builtins=False` only the names in `provided` are there, for jails that empty `__builtins__` - most chains fail in there unless their leaves are in `provided`.
+
+Payloads can be given as source or as gadgets from the generator, with gadgets that take params (e.g. `get_shell`) given as `(gadget, params)` pairs.
+Payloads are run in a pool of worker processes (forkserver where available) with a per payload timeout, and results are cached by the hash of the profile and the payload.
+Workers have their stdin/stdout/stderr redirected to /dev/null, so payloads that spawn shells exit instead of waiting on input.
+
+NOTE: payloads are run for real in the worker processes - only verify payloads that are safe to run on the machine.
+"""
+
+import ast, builtins, collections, hashlib, inspect, json, multiprocessing, os, signal, sys, time
+
+
+#status is one of ok, syntax (does not parse), rejected (filtered by the jail), error (raised an exception), timeout,
+#unsupported (the profile is for versions or platforms the reference jail is not running on)
+VerifyResult = collections.namedtuple('VerifyResult', ['status', 'detail', 'elapsed_ms'])
+
+
+#objects to provide for gadget names that are not builtins nor modules, what the gadget would have returned
+_reference_gadgets = {
+    'builtins_dict': lambda: builtins.__dict__,
+    'list_classes': lambda: object.__subclasses__(),
+    'import_builtin_module': lambda: __import__,
+    'get_obj_dict': lambda: vars,
+    'dict_getitem': lambda: lambda dict, key: dict[key],
+}
+
+def _provided_builtins(provided: list) -> dict:
+    namespace = {}
+    for name in provided:
+        if hasattr(builtins, name):
+            namespace[name] = getattr(builtins, name)
+        elif name in _reference_gadgets:
+            namespace[name] = _reference_gadgets[name]()
+        else:
+            try:
+                namespace[name] = __import__(name)
+            except ImportError:
+                pass  #nothing sensible to provide, the payload will fail with a NameError if it does use it
+    return namespace
+
+
+#platform names used by the gadget docstrings, for sys.platform
+_platform_names = {'linux': 'linux', 'darwin': 'mac', 'win32': 'windows', 'cygwin': 'windows'}
+
+#turns a jailbreak.config style profile into a picklable profile for the workers (defaults to the active config)
+#full_builtins is whether the payload gets the builtins on top of provided, see the module docstring
+def profile_from_config(full_builtins: bool = True, **kwargs) -> dict:
+    if not kwargs:
+        from ..models import set_config
+        kwargs = dict(set_config['restrictions'], provided=set_config['provided'], max_len=set_config['max_len'])
+
+    #search only keys (banned, inline, order, ...) do not change what the jail accepts
+    return {
+        'ast': sorted(n if isinstance(n, str) else n.__name__ for n in kwargs.get('ast', [])),
+        'char': ''.join(sorted(set(kwargs.get('char', '')))),
+        'substr': sorted(kwargs.get('substr', [])),
+        'platforms': sorted(kwargs.get('platforms', [])),
+        'versions': sorted(kwargs.get('versions', [])),
+        'max_len': kwargs.get('max_len'),
+        'provided': sorted(kwargs.get('provided', [])),
+        'full_builtins': full_builtins,
+    }
+
+#why the reference jail cannot stand in for a jail with the profile, or None if it can
+def _unsupported(profile: dict) -> 'str | None':
+    platform = _platform_names.get(sys.platform, sys.platform)
+    if profile['versions'] and sys.version_info[1] not in profile['versions']:
+        return f'reference jail runs 3.{sys.version_info[1]}, profile is for versions {profile["versions"]}'
+    if profile['platforms'] and platform not in profile['platforms']:
+        return f'reference jail runs on {platform}, profile is for platforms {profile["platforms"]}'
+    return None
+
+
+#checks and runs a single payload in the current process, given a profile from profile_from_config
+#expect is an optional name that the payload must have bound to something other than None
+def reference_jail(payload: str, profile: dict, expect: str = None) -> VerifyResult:
+    start = time.perf_counter()
+    elapsed = lambda: (time.perf_counter() - start) * 1000
+
+    try:
+        tree = ast.parse(payload)
+    except SyntaxError as e:
+        return VerifyResult('syntax', str(e), elapsed())
+
+    banned_nodes = {type(n).__name__ for n in ast.walk(tree)}.intersection(profile['ast'])
+    if banned_nodes:
+        return VerifyResult('rejected', f'ast: {sorted(banned_nodes)}', elapsed())
+    banned_chars = set(payload).intersection(profile['char'])
+    if banned_chars:
+        return VerifyResult('rejected', f'char: {sorted(banned_chars)}', elapsed())
+    banned_substrs = [s for s in profile['substr'] if s in payload]
+    if banned_substrs:
+        return VerifyResult('rejected', f'substr: {banned_substrs}', elapsed())
+    if profile['max_len'] is not None and len(payload) > profile['max_len']:
+        return VerifyResult('rejected', f'max_len: {len(payload)}', elapsed())
+
+    unsupported = _unsupported(profile)
+    if unsupported:
+        return VerifyResult('unsupported', unsupported, elapsed())
+
+    env = {'__builtins__': {**(builtins.__dict__ if profile['full_builtins'] else {}), **_provided_builtins(profile['provided'])}}
+    try:
+        exec(compile(tree, '<payload>', 'exec'), env)
+    except _Timeout:
+        return VerifyResult('timeout', '', elapsed())
+    except BaseException as e:
+        return VerifyResult('error', f'{type(e).__name__}: {e}', elapsed())
+
+    if expect and env.get(expect) is None:
+        return VerifyResult('error', f'{expect} is not set by the payload', elapsed())
+    return VerifyResult('ok', '', elapsed())
+
+
+class _Timeout(BaseException):  #BaseException so payloads with bare excepts are less likely to swallow it
+    pass
+
+def _raise_timeout(*_):
+    raise _Timeout()
+
+def _worker_init():
+    #payloads could spawn shells or print, keep them away from our terminal
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    if hasattr(signal, 'SIGALRM'):
+        signal.signal(signal.SIGALRM, _raise_timeout)
+
+def _worker_run(payload: str, profile: dict, expect: str, timeout: float) -> VerifyResult:
+    if hasattr(signal, 'setitimer'):
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return reference_jail(payload, profile, expect)
+    except _Timeout:
+        return VerifyResult('timeout', '', timeout * 1000)
+    finally:
+        if hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+#payload source of a payload given to verify - as is for source, rendered for gadgets (with their params for (gadget, params) pairs)
+def _render(payload) -> str:
+    if isinstance(payload, str):
+        return payload
+    gadget, params = payload if isinstance(payload, tuple) else (payload, ())
+    #the params of the requested gadget are the positional args of its func, see PythonGadget.__call__
+    names = inspect.getfullargspec(gadget.func).args
+    if len(params) != len(names):
+        raise ValueError(f'{gadget.name} takes params {names}, pass (gadget, params) with {len(names)} params instead of {len(params)}')
+    return gadget(*params)
+
+
+class Verifier:
+    #profile kwargs are the same as jailbreak.config, defaults to the active config
+    #cache_path persists the results as json across runs
+    def __init__(self, processes: int = None, timeout: float = 2.0, cache_path: str = None, full_builtins: bool = True, **profile) -> None:
+        self.profile = profile_from_config(full_builtins, **profile)
+        self.timeout = timeout
+        self.processes = processes or os.cpu_count() or 1
+        self.cache_path = cache_path
+        self.cache: 'dict[str, VerifyResult]' = {}
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self.cache = {k: VerifyResult(*v) for k, v in json.load(f).items()}
+
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._ctx = multiprocessing.get_context(method)
+        if method == 'forkserver':
+            self._ctx.set_forkserver_preload([__name__])
+        self._pool = None
+
+    def _key(self, payload: str, expect: str) -> str:
+        return hashlib.sha256(json.dumps([self.profile, expect, payload]).encode()).hexdigest()
+
+    def _get_pool(self):
+        if not self._pool:
+            self._pool = self._ctx.Pool(self.processes, initializer=_worker_init)
+        return self._pool
+
+    #runs all payloads (str, gadgets from the generator, or (gadget, params) pairs for gadgets that take params) and returns the results in the same order
+    def verify(self, payloads: list, expect: str = None) -> 'list[VerifyResult]':
+        payloads = [_render(p) for p in payloads]
+        keys = [self._key(p, expect) for p in payloads]
+
+        pending = {}
+        for payload, key in zip(payloads, keys):
+            if key not in self.cache and key not in pending:
+                pending[key] = self._get_pool().apply_async(_worker_run, (payload, self.profile, expect, self.timeout))
+
+        #the workers enforce the timeout themselves, but a payload stuck in native code cannot be interrupted
+        #tasks are handed out in order, so the nth task should be done within (n // processes + 1) timeouts
+        grace = 1.0
+        start = time.monotonic()
+        hung = False
+        for i, (key, result) in enumerate(pending.items()):
+            allowed = start + (i // self.processes + 1) * (self.timeout + grace) - time.monotonic()
+            try:
+                self.cache[key] = result.get(timeout=max(allowed, 0))
+            except multiprocessing.TimeoutError:
+                self.cache[key] = VerifyResult('timeout', 'worker stuck, killed', self.timeout * 1000)
+                hung = True
+
+        if hung:
+            #the stuck worker would block the pool forever, start over next time
+            self._pool.terminate()
+            self._pool = None
+
+        if self.cache_path and pending:
+            with open(self.cache_path, 'w') as f:
+                json.dump(self.cache, f)
+
+        return [self.cache[key] for key in keys]
+
+    def verify_one(self, payload, expect: str = None) -> VerifyResult:
+        return self.verify([payload], expect)[0]
+
+    def close(self):
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Verify payloads (one file per payload) against a reference jail.')
+    parser.add_argument('payloads', nargs='+', help='files containing a payload each')
+    parser.add_argument('--char', default='', help='banned characters')
+    parser.add_argument('--substr', nargs='*', default=[], help='banned substrings')
+    parser.add_argument('--ast', nargs='*', default=[], help='banned ast node names (e.g. Call)')
+    parser.add_argument('--provided', nargs='*', default=[], help='names provided in the jail builtins')
+    parser.add_argument('--platforms', nargs='*', default=[], help='platforms the jail runs on (linux, mac, windows)')
+    parser.add_argument('--versions', nargs='*', type=int, default=[], help='python 3 minor versions the jail runs on')
+    parser.add_argument('--max-len', type=int, help='maximum payload length')
+    parser.add_argument('--empty-builtins', action='store_true', help='only provide the names in --provided as builtins')
+    parser.add_argument('--expect', help='name the payload must bind')
+    parser.add_argument('--timeout', type=float, default=2.0)
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--cache', help='json file to cache results in')
+    args = parser.parse_args()
+
+    payloads = []
+    for path in args.payloads:
+        with open(path) as f:
+            payloads.append(f.read())
+
+    with Verifier(args.processes, args.timeout, args.cache, not args.empty_builtins, ast=[getattr(ast, n) for n in args.ast], char=args.char, substr=args.substr,
+                  platforms=args.platforms, versions=args.versions, max_len=args.max_len, provided=args.provided) as verifier:
+        results = verifier.verify(payloads, args.expect)
+
+    for path, result in zip(args.payloads, results):
+        print(f'{result.status:<10} {result.elapsed_ms:>8.1f}ms {path} {result.detail}')
+    sys.exit(any(r.status != 'ok' for r in results))
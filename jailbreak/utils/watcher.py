@@ -0,0 +1,132 @@
+"""
+This utility watches the gadget and converter files of the repo, and hot reloads the ones that changed into the running catalog,
+for long running processes (e.g. a payload service) that would otherwise have to restart and throw away everything the searcher has cached.
+
+Changes are picked up by polling the mtimes of the files, either manually via `poll` or every `interval` seconds in a background thread via `start`:
+ - changed gadget files are reloaded, and only the gadget variants whose code actually changed are registered again (or unregistered if they are gone)
+ - new gadget files are imported and registered, removed gadget files have all of their gadget variants unregistered
+ - changed converter files are reloaded, and the old versions of their converters are unregistered
+
+Everything goes through `register_user_gadget` / `unregister_user_gadget` / `unregister_converter`, so the dependency graph and feasibility matrix
+are updated incrementally, the cached conversions of only the changed gadgets and converters are dropped, and `models.catalog_version` is bumped.
+
+NOTE: polling is used instead of inotify since the latter is linux only and needs a third party package; the catalog is small enough for this to be cheap
+XXX reloads are not synchronized with searches, so a search that runs while the background thread reloads could see a half updated catalog
+"""
+
+import importlib, inspect, os, sys, threading, traceback
+
+
+class CatalogWatcher:
+    def __init__(self, interval: float = 1.0) -> None:
+        from .. import gadgets, converters
+        self.interval = interval
+        self.gadgets_path = gadgets.__path__[0]
+        self.converters_path = converters.__path__[0]
+
+        #path -> (mtime, size) as of the last poll
+        self.stamps: 'dict[str, tuple[int, int]]' = self._scan()
+        self._stop = threading.Event()
+        self._thread: 'threading.Thread | None' = None
+
+    def _scan(self) -> 'dict[str, tuple[int, int]]':
+        stamps = {}
+        for root in [self.gadgets_path, self.converters_path]:
+            for path, _, filenames in os.walk(root):
+                for f in filenames:
+                    if os.path.splitext(f)[1].lower() == '.py' and f != '__init__.py':
+                        filename = os.path.join(path, f)
+                        stat = os.stat(filename)
+                        stamps[filename] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    #checks the files once and reloads everything that changed, returns the changed paths
+    def poll(self) -> 'list[str]':
+        stamps = self._scan()
+        changed = sorted(path for path in stamps.keys() | self.stamps.keys() if stamps.get(path) != self.stamps.get(path))
+        for path in changed:
+            #mark it as seen first, so a file that fails to load (e.g. mid edit) is only retried once it changes again
+            if path in stamps:
+                self.stamps[path] = stamps[path]
+            else:
+                del self.stamps[path]
+
+            if path.startswith(self.converters_path + os.sep):
+                self._reload_converters(path, path in stamps)
+            else:
+                self._reload_gadgets(path, path in stamps)
+        return changed
+
+    #imports the module from scratch, reload would keep the functions that were removed from the file around in the module
+    def _import_fresh(self, module_name: str):
+        sys.modules.pop(module_name, None)
+        return importlib.import_module(module_name)
+
+    #same module naming as get_all_gadgets_in_repo
+    def _gadget_module(self, path: str) -> 'tuple[str, str, str]':
+        from .. import gadgets
+        relpath = os.path.relpath(os.path.splitext(path)[0], self.gadgets_path)
+        gadget_type = relpath.split(os.sep)[0]
+        return gadget_type, os.path.basename(relpath), gadgets.__name__ + '.' + relpath.replace(os.sep, '.')
+
+    def _reload_gadgets(self, path: str, exists: bool):
+        from .. import models, register_user_gadget, unregister_user_gadget
+
+        gadget_type, filename, module_name = self._gadget_module(path)
+        if gadget_type not in models.all_gadgets:
+            #XXX new gadget types need the models for it first, which needs a restart anyway
+            return
+
+        catalog = models.all_gadgets[gadget_type]
+        old = {name: func for name, func in catalog.items() if getattr(func, '__module__', None) == module_name}
+        new = {}
+        if exists:
+            module = self._import_fresh(module_name)
+            new = {attrname: getattr(module, attrname) for attrname in dir(module) if attrname.startswith(filename) and inspect.isfunction(getattr(module, attrname))}
+
+        for name in old.keys() - new.keys():
+            unregister_user_gadget(name, gadget_type)
+        for name, func in new.items():
+            #same code means the same gadget, keep the old func so nothing derived from it is invalidated
+            if name not in old or old[name].__code__ != func.__code__:
+                register_user_gadget(func, gadget_type)
+
+    def _reload_converters(self, path: str, exists: bool):
+        from .. import converters, models
+
+        module_name = converters.__name__ + '.' + os.path.splitext(os.path.basename(path))[0].lower()
+        old = [func for func in models.registered_converters if func.__module__ == module_name]
+        if exists:
+            #importing again reruns @register_converter for the new versions
+            module = self._import_fresh(module_name)
+            setattr(converters, module_name.rsplit('.', 1)[1], module)
+        #XXX converters are always replaced since they have no stable identity like gadget names, which moves them to the end of the converters tried for a violation
+        for func in old:
+            models.unregister_converter(func)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                #keep watching, the file will be reloaded again once it is fixed
+                traceback.print_exc()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='jailbreak-catalog-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()